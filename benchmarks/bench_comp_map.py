@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+    Benchmark for the definition of many similar jobs: a loop calling
+    QuickAppContext.comp() versus one call to QuickAppContext.comp_map(),
+    with and without a large common argument.
+
+    Usage:
+
+        python benchmarks/bench_comp_map.py [N ...]
+
+    Prints the jobs defined per second.
+"""
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+from compmake import Context
+from compmake.storage.filesystem import StorageFilesystem
+from quickapp import QuickAppContext
+
+
+def g(x, table):
+    return table[x % len(table)]
+
+
+def with_loop(context, n, table):
+    return [context.comp(g, i, table) for i in range(n)]
+
+
+def with_comp_map(context, n, table):
+    return context.comp_map(g, range(n), table=table)
+
+
+def main(args):
+    sizes = [int(a) for a in args]
+    if not sizes:
+        sizes = [200, 1000]
+
+    for n in sizes:
+        for table_size in [10, 5000]:
+            table = list(range(table_size))
+            for name, define in [('loop', with_loop), ('comp_map', with_comp_map)]:
+                root = mkdtemp()
+                try:
+                    cc = Context(db=StorageFilesystem(os.path.join(root, 'compmake')))
+                    context = QuickAppContext(cc=cc, qapp=None, parent=None,
+                                              job_prefix=None, output_dir=root)
+                    t0 = time.time()
+                    define(context, n, table)
+                    delta = time.time() - t0
+                    print('n = %6d  table: %5d  %-8s  %8.0f jobs/s'
+                          % (n, table_size, name, n / delta))
+                finally:
+                    shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+    Benchmark for quickapp.report_manager.make_sections().
+
+    Usage:
+
+        python benchmarks/bench_make_sections.py [--legacy] [N ...]
+
+    With --legacy, the previous recursive implementation (based on
+    StoreResults.groups_by_field_value/remove_field) is also timed,
+    for the sizes up to 100k.
+"""
+import sys
+import time
+from pprint import pformat
+
+from quickapp.report_manager import make_sections
+from reprep.report_utils import StoreResults
+
+
+def sweep(n):
+    """ A sweep with 4 fields and roughly n keys. """
+    sizes = dict(alpha=10, beta=5, gamma=20)
+    rest = max(1, n // (10 * 5 * 20))
+    reports = StoreResults()
+    for a in range(sizes['alpha']):
+        for b in range(sizes['beta']):
+            for c in range(sizes['gamma']):
+                for d in range(rest):
+                    key = dict(report='r%d' % (a % 3), alpha=a, beta='b%d' % b,
+                               gamma=c, delta=d)
+                    reports[key] = 'report/%d-%d-%d-%d.html' % (a, b, c, d)
+    return reports
+
+
+def legacy_make_sections(allruns, common=None):
+    if common is None:
+        common = {}
+    if len(allruns) == 1:
+        key = list(allruns.keys())[0]
+        return dict(type='sample', common=common, key=key, value=allruns[key])
+    fields_size = [(field, len(list(allruns.groups_by_field_value(field))))
+                   for field in sorted(allruns.field_names_in_all_keys())]
+    fields_size.sort(key=lambda x: x[1])
+    if not fields_size:
+        raise ValueError(pformat(list(allruns.keys())))
+    field = fields_size[0][0]
+    division = {}
+    for value, samples in allruns.groups_by_field_value(field):
+        samples = samples.remove_field(field)
+        c = dict(common)
+        c[field] = value
+        division[value] = legacy_make_sections(samples, common=c)
+    return dict(type='division', field=field, division=division, common=common)
+
+
+def timeit(f, *args):
+    t0 = time.time()
+    res = f(*args)
+    return time.time() - t0, res
+
+
+def main(args):
+    legacy = '--legacy' in args
+    sizes = [int(a) for a in args if a != '--legacy']
+    if not sizes:
+        sizes = [10000, 100000, 1000000]
+
+    for n in sizes:
+        reports = sweep(n)
+        t, sections = timeit(make_sections, reports)
+        line = 'n = %8d  make_sections: %7.2f s' % (len(reports), t)
+        if legacy and n <= 100000:
+            t_legacy, sections_legacy = timeit(legacy_make_sections, reports)
+            assert sections == sections_legacy
+            line += '   legacy: %7.2f s' % t_legacy
+        print(line)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+    Benchmark for the directory operations on the reports of one type,
+    in the 'flat' and 'hashed' layouts (see ReportManager.set_report_layout()):
+    creating the report files and their resources directories, checking
+    that they exist, listing and stat-ing them.
+
+    Usage:
+
+        python benchmarks/bench_report_layout.py [N ...] [--dir DIR]
+
+    Use --dir to run it on another filesystem (e.g. an NFS mount);
+    the times are per report.
+"""
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+from quickapp.report_manager import basename_from_key, hashed_subdirs
+
+
+def report_filenames(root, n, layout):
+    filenames = []
+    for i in range(n):
+        basename = 'myreport-' + basename_from_key(dict(alpha=i % 100, beta=i // 100))
+        dirname = os.path.join(root, 'myreport')
+        if layout == 'hashed':
+            dirname = os.path.join(dirname, *hashed_subdirs(basename))
+        filenames.append(os.path.join(dirname, basename + '.html'))
+    return filenames
+
+
+def create(filenames):
+    for filename in filenames:
+        resources = os.path.splitext(filename)[0]
+        os.makedirs(resources, exist_ok=True)
+        with open(os.path.join(resources, 'figure.png'), 'w') as f:
+            f.write('png')
+        with open(filename, 'w') as f:
+            f.write('report')
+
+
+def exists(filenames):
+    for filename in filenames:
+        assert os.path.exists(filename)
+
+
+def listing(root):
+    n = 0
+    for _, _, files in os.walk(os.path.join(root, 'myreport')):
+        n += len(files)
+    return n
+
+
+def stat(filenames):
+    for filename in filenames:
+        os.stat(filename)
+
+
+def timeit(f, *args):
+    t0 = time.time()
+    res = f(*args)
+    return time.time() - t0, res
+
+
+def main(args):
+    base = None
+    if '--dir' in args:
+        i = args.index('--dir')
+        base = args[i + 1]
+        args = args[:i] + args[i + 2:]
+    sizes = [int(a) for a in args]
+    if not sizes:
+        sizes = [10000, 50000]
+
+    for n in sizes:
+        for layout in ['flat', 'hashed']:
+            root = mkdtemp(dir=base)
+            try:
+                filenames = report_filenames(root, n, layout)
+                t_create, _ = timeit(create, filenames)
+                t_exists, _ = timeit(exists, filenames)
+                t_list, _ = timeit(listing, root)
+                t_stat, _ = timeit(stat, filenames)
+                print('n = %7d  %-6s  create: %6.1f us  exists: %5.1f us  '
+                      'walk: %5.1f us  stat: %5.1f us'
+                      % (n, layout, t_create / n * 1e6, t_exists / n * 1e6,
+                         t_list / n * 1e6, t_stat / n * 1e6))
+            finally:
+                shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+    Benchmark for the size and time of pickling a ReportManager,
+    as done when the reports of the branches are merged.
+
+    Usage:
+
+        python benchmarks/bench_report_manager_pickle.py [N ...]
+
+    "legacy" is the state of the previous ReportManager: a reference to
+    the context, plus two StoreResults with frozendict2 keys, the
+    first one mapping to the Promise of the reports.
+"""
+import os
+import pickle
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+from compmake import Context, Promise
+from compmake.storage.filesystem import StorageFilesystem
+from quickapp import QuickAppContext, ReportManager
+from reprep.report_utils import StoreResults
+
+
+def fill(rm, n):
+    """ Registers n reports of 4 types, with 3 fields each. """
+    for i in range(n):
+        key = dict(report='report%d' % (i % 4), alpha=i % 10, beta='b%d' % (i // 10 % 10),
+                   gamma=i // 100)
+        report_type = key.pop('report')
+        rm._check_report_format(report_type, **key)
+        filename = os.path.join(rm.outdir, report_type, '%s-%d.html' % (report_type, i))
+        rm._registry.add(dict(report=report_type, **key), 'job-%d' % i, filename)
+
+
+def legacy_state(rm, context):
+    allreports = StoreResults()
+    allreports_filename = StoreResults()
+    for key, job_id, filename in rm._registry.items():
+        allreports[key] = Promise(job_id)
+        allreports_filename[key] = filename
+    state = dict(rm.__dict__)
+    del state['_registry']
+    state.update(context=context, allreports=allreports,
+                 allreports_filename=allreports_filename)
+    return state
+
+
+def timeit(f, *args):
+    t0 = time.time()
+    res = f(*args)
+    return time.time() - t0, res
+
+
+def main(args):
+    sizes = [int(a) for a in args]
+    if not sizes:
+        sizes = [10000]
+
+    root = mkdtemp()
+    try:
+        cc = Context(db=StorageFilesystem(os.path.join(root, 'compmake')))
+        context = QuickAppContext(cc=cc, qapp=None, parent=None, job_prefix=None,
+                                  output_dir=root)
+        for n in sizes:
+            rm = ReportManager(context, os.path.join(root, 'report'))
+            fill(rm, n)
+            for name, x in [('legacy', legacy_state(rm, context)), ('current', rm)]:
+                t_dump, data = timeit(pickle.dumps, x, pickle.HIGHEST_PROTOCOL)
+                t_load, _ = timeit(pickle.loads, data)
+                print('n = %7d  %-8s %9d bytes (%5.1f KB/1000 reports)  '
+                      'dump: %6.3f s  load: %6.3f s'
+                      % (n, name, len(data), len(data) / 1024.0 * 1000 / n, t_dump, t_load))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+    Benchmark for the HTML written around the reports: the navigation
+    links of each report page, and the index, with and without the
+    precompressed ``.gz`` copies.
+
+    Usage:
+
+        python benchmarks/bench_write_html.py [N ...]
+
+    The times are per report.
+"""
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+from quickapp.report_manager import create_links_html, find_others, index_reports
+from quickapp.rm import HTMLWriter, ReportManifest, SharedReports
+from reprep.report_utils import StoreResults
+
+
+def sweep(root, n):
+    """ Roughly n reports of 2 types, with 3 fields. """
+    reports = StoreResults()
+    per_type = max(1, n // 2)
+    for t in ['ra', 'rb']:
+        for i in range(per_type):
+            key = dict(report=t, alpha=i % 20, beta='b%d' % (i // 20 % 10), gamma=i // 200)
+            reports[key] = os.path.join(root, 'report', t, '%s-%d.html' % (t, i))
+    return reports
+
+
+def timeit(f, *args, **kwargs):
+    t0 = time.time()
+    res = f(*args, **kwargs)
+    return time.time() - t0, res
+
+
+def main(args):
+    sizes = [int(a) for a in args]
+    if not sizes:
+        sizes = [1000, 10000]
+
+    for n in sizes:
+        root = mkdtemp()
+        try:
+            reports = sweep(root, n)
+            shared = SharedReports(reports)
+            index = os.path.join(root, 'report.html')
+            # 200 pages, for the links
+            sample = list(reports)[::max(1, len(reports) // 200)]
+
+            def links():
+                for key in sample:
+                    this_report = dict(key)
+                    report_type = this_report.pop('report')
+                    others = find_others(shared.type2reports(), key,
+                                         similarity=shared.similarity())
+                    out = HTMLWriter()
+                    out.write(create_links_html(this_report, shared.variations(report_type),
+                                                index, others))
+                    out.save(os.path.join(root, 'links.html'))
+
+            for filename in reports.values():
+                if not os.path.exists(os.path.dirname(filename)):
+                    os.makedirs(os.path.dirname(filename))
+                with open(filename, 'w') as f:
+                    f.write('report')
+            manifest = ReportManifest()
+
+            shared.variations('ra')  # not part of the timing
+            t_links, _ = timeit(links)
+            t_index, _ = timeit(index_reports, reports, index, manifest=manifest)
+            t_index_gz, _ = timeit(index_reports, reports, index, manifest=manifest, gzip=True)
+            size = os.path.getsize(index)
+            size_gz = os.path.getsize(index + '.gz')
+            print('n = %7d  links: %7.1f us/report   index: %5.1f us/report   '
+                  'index + gz: %5.1f us/report   (%d -> %d bytes)'
+                  % (len(reports), t_links / len(sample) * 1e6,
+                     t_index / len(reports) * 1e6, t_index_gz / len(reports) * 1e6,
+                     size, size_gz))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,22 +1,31 @@
 import os
-from typing import List, TypeVar, Callable
+import pickle
+import time
+from typing import List, Optional, TypeVar, Callable
 
 import six
 
 from compmake import Context, Promise
 from compmake.context import load_static_storage
+from compmake.jobs.storage import job_args_sizeof
 from conf_tools import GlobalConfig
 from contracts import  contract, describe_type
 from contracts.utils import raise_wrapped
+from .definition_profile import DefinitionProfile
 from .report_manager import ReportManager
+from .rm import ReportsDelta
 from .resource_manager import ResourceManager
 from zuper_commons.types import check_isinstance
 
 __all__ = [
     'CompmakeContext',
     'QuickAppContext',
+    'PromiseList',
 ]
 
+# comp_map(): above this size, the common arguments are stored by a separate job
+COMP_MAP_INLINE_MAX = 10000
+
 
 class QuickAppContext:
 
@@ -31,7 +40,7 @@ class QuickAppContext:
         self.cc = cc
         # can be removed once subtask() is removed
         self._qapp = qapp
-        # only used for count invocation
+        # also gives the dependencies of the parent; see _get_extra_dep()
         self._parent = parent
         self._job_prefix = job_prefix
 
@@ -42,16 +51,38 @@ class QuickAppContext:
             self.private_report_manager = True  # only create indexe if this is true
             reports = os.path.join(output_dir, 'report')
             reports_index = os.path.join(output_dir, 'report.html')
-            report_manager = ReportManager(self, reports, reports_index)
+            if parent is not None:
+                # static files and blobs are shared with the parent
+                parent_report_manager = parent.get_report_manager()
+                shared_root = parent_report_manager.shared_root
+            else:
+                parent_report_manager = shared_root = None
+            report_manager = ReportManager(self, reports, reports_index,
+                                           shared_root=shared_root)
+            if parent_report_manager is not None:
+                # the blob store too, if set_blob_store() was called before
+                report_manager.blobs_dir = parent_report_manager.blobs_dir
         else:
             self.private_report_manager = False
 
         self._report_manager = report_manager
         self._resource_manager = resource_manager
         self._output_dir = output_dir
-        self.n_comp_invocations = 0
+        # comp() invocations in this context only; see n_comp_invocations
+        self._n_comp_own = 0
+        # the dependencies of the jobs of this context, besides those of the parent
         self._extra_dep = extra_dep
+        # jobs defined in this context (job_id -> Promise), and in order
         self._jobs = {}
+        self._jobs_order = []
+        # contexts whose jobs are also ours; see add_jobs_of()
+        self._jobs_of = []
+        # the last barrier, and for each context the number of its jobs
+        # done before it; see barrier()
+        self._barrier = None
+        self._barrier_covered = {}
+        # DefinitionProfile, if profiling the definition of the jobs
+        self._profile = None
         if extra_report_keys is None:
             extra_report_keys = {}
         self.extra_report_keys = extra_report_keys
@@ -68,7 +99,19 @@ class QuickAppContext:
     #     return list(self._jobs.values())
 
     def all_jobs_dict(self):
-        return dict(self._jobs)
+        """ Returns job_id -> Promise for the jobs defined in this context,
+            including those of the contexts given to add_jobs_of(). """
+        jobs = {}
+        stack = [self]
+        while stack:
+            context = stack.pop()
+            jobs.update(context._jobs)
+            stack.extend(context._jobs_of)
+        return jobs
+
+    def add_jobs_of(self, context: "QuickAppContext") -> None:
+        """ Considers the jobs of ``context`` (also those defined later) as ours. """
+        self._jobs_of.append(context)
 
     def checkpoint(self, job_name: str) -> Promise:
         """
@@ -80,13 +123,64 @@ class QuickAppContext:
             This means that all successive jobs will require that the previous
             ones be done.
 
+            Now the same as barrier().
+
             Returns the checkpoint job (CompmakePromise).
         """
-        job_checkpoint = self.comp(checkpoint, job_name,
-                                   prev_jobs=list(self._jobs.values()),
-                                   job_id=job_name)
-        self._extra_dep.append(job_checkpoint)
-        return job_checkpoint
+        return self.barrier(job_name)
+
+    def barrier(self, job_name: str) -> Promise:
+        """
+            Creates a dummy job called "job_name" that is done after all
+            jobs previously defined, and makes all successive jobs of this
+            context depend on it.
+
+            The barrier depends directly only on the previous barrier and
+            on the jobs that it does not cover yet, so that a sequence of
+            barriers adds O(N) dependencies overall (and not O(N^2)); only
+            the jobs defined since the previous barrier are visited.
+
+            The children of this context, also those created before,
+            see the barrier too.
+
+            Returns the barrier job.
+        """
+        previous = self._barrier
+        extra_dep = []
+        stack = [self]
+        while stack:
+            context = stack.pop()
+            covered = self._barrier_covered.get(context, 0)
+            extra_dep.extend(context._jobs_order[covered:])
+            self._barrier_covered[context] = len(context._jobs_order)
+            stack.extend(context._jobs_of)
+        if previous is not None and previous not in self._extra_dep:
+            # (jobs of this context already depend on it through _extra_dep)
+            extra_dep.append(previous)
+        promise = self.comp(barrier, job_name, extra_dep=extra_dep, job_id=job_name)
+        self._barrier_covered[self] = len(self._jobs_order)
+
+        # (in place: the children refer to the list)
+        if previous is not None and previous in self._extra_dep:
+            self._extra_dep.remove(previous)
+        self._extra_dep.append(promise)
+        self._barrier = promise
+        return promise
+
+    def _get_extra_dep(self) -> List[Promise]:
+        """ The dependencies of the jobs of this context, including those of the parents. """
+        if self._parent is None:
+            return self._extra_dep
+        inherited = self._parent._get_extra_dep()
+        if not self._extra_dep:
+            return inherited
+        if not inherited:
+            return self._extra_dep
+        return inherited + self._extra_dep
+
+    def _add_job(self, promise: Promise) -> None:
+        self._jobs[promise.job_id] = promise
+        self._jobs_order.append(promise)
 
     #
     # Wrappers form Compmake's "comp".
@@ -96,19 +190,91 @@ class QuickAppContext:
             Simple wrapper for Compmake's comp function.
             Use this instead of "comp".
         """
-        self.count_comp_invocations()
-        self.cc.comp_prefix(self._job_prefix)
+        t0 = time.time()
+        self._n_comp_own += 1
+        if self.cc.get_comp_prefix() != self._job_prefix:
+            self.cc.comp_prefix(self._job_prefix)
 
-        other_extra = kwargs.get('extra_dep', [])
+        other_extra = kwargs.get('extra_dep', None)
         if isinstance(other_extra, Promise):
             other_extra = [other_extra]
 
-        extra_dep = self._extra_dep + other_extra
-        kwargs['extra_dep'] = extra_dep
+        extra_dep = self._get_extra_dep()
+        if other_extra:
+            kwargs['extra_dep'] = extra_dep + other_extra
+        else:
+            # compmake does not keep the list, it can be shared
+            kwargs['extra_dep'] = extra_dep
         promise = self.cc.comp(f, *args, **kwargs)
-        self._jobs[promise.job_id] = promise
+        self._add_job(promise)
+        if self._profile is not None:
+            self._profile_jobs([promise], t0)
         return promise
 
+    def comp_map(self, f, iterable, job_id_fn=None, extra_dep=None,
+                 **common_kwargs) -> "PromiseList":
+        """
+            Defines one job ``f(x, **common_kwargs)`` for each x in
+            ``iterable``, and returns the list of their promises. Passed
+            to another job, it becomes the list of the results.
+
+            If they are large (more than COMP_MAP_INLINE_MAX bytes pickled),
+            the common arguments are stored once, by a separate job, instead
+            of being pickled with every job; small ones are passed inline,
+            as every job depending on that job would slow down the definition.
+
+            :param job_id_fn: function x -> job id; by default the ids
+                are chosen as comp() would do.
+            :param extra_dep: extra dependencies of all the jobs.
+        """
+        if isinstance(extra_dep, Promise):
+            extra_dep = [extra_dep]
+        if extra_dep:
+            extra_dep = self._get_extra_dep() + extra_dep
+        else:
+            extra_dep = self._get_extra_dep()
+
+        xs = list(iterable)
+        shared = (common_kwargs and
+                  len(pickle.dumps(common_kwargs, pickle.HIGHEST_PROTOCOL)) > COMP_MAP_INLINE_MAX)
+        if shared:
+            common = self.comp(load_static_storage, common_kwargs,
+                               command_name=f.__name__ + '-common')
+
+        # (after list(): the iterable could define jobs itself)
+        t0 = time.time()
+        self.cc.comp_prefix(self._job_prefix)
+        promises = PromiseList()
+        for x in xs:
+            kwargs = dict(extra_dep=extra_dep, command_name=f.__name__)
+            if job_id_fn is not None:
+                kwargs['job_id'] = job_id_fn(x)
+            if shared:
+                promise = self.cc.comp(_comp_map_call, f, x, common, **kwargs)
+            else:
+                kwargs.update(common_kwargs)
+                promise = self.cc.comp(f, x, **kwargs)
+            self._add_job(promise)
+            promises.append(promise)
+        self._n_comp_own += len(promises)
+        if self._profile is not None:
+            self._profile_jobs(promises, t0)
+        return promises
+
+    def _profile_jobs(self, promises, t0: float) -> None:
+        t1 = time.time()
+        db = self.cc.get_compmake_db()
+        nbytes = sum(job_args_sizeof(p.job_id, db) for p in promises)
+        self._profile.add_jobs(len(promises), t1 - t0, nbytes,
+                               overhead=time.time() - t1)
+
+    def set_definition_profile(self, profile: DefinitionProfile) -> None:
+        """ Starts recording the statistics of comp() here and in the children created later. """
+        self._profile = profile
+
+    def get_definition_profile(self) -> Optional[DefinitionProfile]:
+        return self._profile
+
     def comp_dynamic(self, f, *args, **kwargs) -> Promise:
         # XXX: we really dont need it
         context = self._get_promise()
@@ -156,9 +322,22 @@ class QuickAppContext:
         return self.comp_dynamic(wrap_state_dynamic, config_state, f, *args, **kwargs)
 
     def count_comp_invocations(self)->None:
-        self.n_comp_invocations += 1
-        if self._parent is not None:
-            self._parent.count_comp_invocations()
+        self._n_comp_own += 1
+
+    @property
+    def n_comp_invocations(self) -> int:
+        """ Number of comp() invocations in this context and its children. """
+        n = 0
+        stack = [self]
+        while stack:
+            context = stack.pop()
+            n += context._n_comp_own
+            stack.extend(context.branched_children)
+        return n
+
+    def get_comp_prefix(self):
+        """ Returns the prefix of the ids of the jobs defined by comp() """
+        return self._job_prefix
 
     def get_output_dir(self):
         """ Returns a suitable output directory for data files """
@@ -231,8 +410,6 @@ class QuickAppContext:
         else:
             resource_manager = self._resource_manager
 
-        _extra_dep = self._extra_dep + extra_dep
-
         extra_report_keys_ = {}
         extra_report_keys_.update(self.extra_report_keys)
         if extra_report_keys is not None:
@@ -245,7 +422,9 @@ class QuickAppContext:
                              resource_manager=resource_manager,
                              extra_report_keys=extra_report_keys_,
                              output_dir=output_dir,
-                             extra_dep=_extra_dep)
+                             extra_dep=list(extra_dep))
+        if self._profile is not None:
+            c1.set_definition_profile(self._profile.child(name))
         self.branched_children.append(c1)
         return c1
 
@@ -338,9 +517,27 @@ def wrap_state_dynamic(context, config_state, f, *args, **kwargs):
 
 
 def checkpoint(name, prev_jobs):
+    # (the jobs defined by checkpoint() before it used barrier())
+    pass
+
+
+def barrier(name):
+    """ The job created by QuickAppContext.barrier(). """
     pass
 
 
+class PromiseList(list):
+    """ The promises of the jobs defined by QuickAppContext.comp_map(). """
+
+    def job_ids(self) -> List[str]:
+        return [p.job_id for p in self]
+
+
+def _comp_map_call(f, x, common):
+    """ Used internally by comp_map() """
+    return f(x, **common)
+
+
 @contract(context=Context, returns='dict')
 def _dynreports_wrap_dynamic(context, qc, function, args, kw):
     """
@@ -348,6 +545,10 @@ def _dynreports_wrap_dynamic(context, qc, function, args, kw):
     """
 
     qc.cc = context
+    # only the reports added from here on are sent back
+    since = qc.get_report_manager().num_reports()
+    # the compmake context is shared by the dynamic jobs run in this process
+    original = context.get_comp_prefix()
 
     res = {}
     try:
@@ -356,18 +557,30 @@ def _dynreports_wrap_dynamic(context, qc, function, args, kw):
         msg = 'Could not call %r' % function
         raise_wrapped(TypeError, e, msg, args=args, kw=kw)
 
-    res['context-res'] = context_get_merge_data(qc)
+    res['context-res'] = context_get_merge_data(qc, since=since)
+    context.comp_prefix(original)
     return res
 
 
 @contract(branched='list(dict)')
 def _dynreports_merge(branched):
+    """
+        Merges the data of several contexts: the ReportsDelta of the branches
+        are combined, and applied to the ReportManager if there is one.
+    """
     rm = None
-    for i, b in enumerate(branched):
-        if i == 0:
-            rm = b['report_manager']
+    delta = ReportsDelta()
+    for b in branched:
+        if 'report_manager' in b:
+            if rm is None:
+                rm = b['report_manager']
+            else:
+                rm.merge(b['report_manager'])
         else:
-            rm.merge(b['report_manager'])
+            delta.update(b['report_delta'])
+    if rm is None:
+        return dict(report_delta=delta)
+    rm.apply_delta(delta)
     return dict(report_manager=rm)
 
 
@@ -391,16 +604,34 @@ def get_branched_contexts(context):
     return res
 
 
-def context_get_merge_data(context):
-    rm = context.get_report_manager()
-    data = [dict(report_manager=rm)]
+# maximum number of branches merged by one job
+MERGE_FAN_IN = 8
+
 
-    data.extend(get_branched_contexts(context))
+def context_get_merge_data(context, since=None):
+    """
+        Returns the data (or the promise of it) needed to create the index:
+        dict(report_manager=...) for the root context. For a dynamic branch
+        (``since`` given) only the reports added after the first ``since``
+        are returned, as dict(report_delta=ReportsDelta).
 
-    if len(data) > 1:
-        return context.cc.comp(_dynreports_merge, data)
+        The data of the branches is merged by a tree of jobs, each
+        merging at most MERGE_FAN_IN branches.
+    """
+    rm = context.get_report_manager()
+    if since is None:
+        data = dict(report_manager=rm)
     else:
-        return data[0]
+        data = dict(report_delta=rm.get_delta(since))
+
+    branched = get_branched_contexts(context)
+    if not branched:
+        return data
+
+    while len(branched) > MERGE_FAN_IN:
+        branched = [context.cc.comp(_dynreports_merge, branched[i:i + MERGE_FAN_IN])
+                    for i in range(0, len(branched), MERGE_FAN_IN)]
+    return context.cc.comp(_dynreports_merge, [data] + branched)
 
 
 CompmakeContext = QuickAppContext
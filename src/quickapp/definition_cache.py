@@ -0,0 +1,138 @@
+import hashlib
+import inspect
+import os
+import pickle
+import socket
+import sys
+from typing import List, Optional
+
+from compmake.jobs.storage import all_jobs
+
+from . import logger
+
+__all__ = [
+    'DefinitionCache',
+]
+
+# options that do not change the jobs defined
+OPTIONS_NOT_IN_KEY = ['command', 'console', 'reset', 'definition_cache', 'contracts',
+                      'profile_definition']
+
+
+class DefinitionCache:
+    """
+        Remembers the jobs defined by the last run of QuickApp.go(), so that
+        a rerun with the same options and the same code does not need to
+        call define_jobs_context() again: the jobs, and the state of the
+        report managers (in the arguments of the index job), are already
+        in the compmake DB.
+
+        The key is the hash of the parsed options, of the app class, and of
+        the content of the source files of the packages defining the
+        QuickApp classes involved (the app and those given to
+        call_recursive(), and their bases), so helper modules in the same
+        packages are covered. Changes to other packages used by
+        define_jobs_context(), or to data files it reads, are not
+        detected: in that case run once without --definition_cache,
+        which removes the cache.
+
+        The cache is kept in the output directory (compmake does not want
+        other files in its storage directory); it is not used if some of
+        the jobs are not in the DB anymore.
+    """
+
+    def __init__(self, output_dir: str):
+        self.filename = os.path.join(output_dir, 'quickapp-definition.pickle')
+
+    def load(self, qapp_class, options) -> Optional[List[str]]:
+        """
+            Returns the ids of the jobs defined by the last run, or None
+            if the cache is missing or stale, or if the DB lost some jobs.
+        """
+        if not os.path.exists(self.filename):
+            return None
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning('Cannot read %s: %s' % (self.filename, e))
+            return None
+
+        key = definition_key(qapp_class, options, data['sources'])
+        if key != data['key']:
+            logger.info('Definition cache is stale; defining the jobs.')
+            return None
+        return data['jobs']
+
+    def save(self, qapp_class, options, classes, jobs: List[str]) -> None:
+        sources = source_files(classes)
+        data = dict(key=definition_key(qapp_class, options, sources),
+                    sources=sources, jobs=sorted(jobs))
+        tmp = '%s.tmp-%s-%s' % (self.filename, socket.gethostname(), os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.filename)
+
+    def invalidate(self) -> None:
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+
+def jobs_missing(db, jobs: List[str]) -> List[str]:
+    """ Returns the jobs which are not in the DB anymore. """
+    existing = set(all_jobs(db=db))
+    return [job_id for job_id in jobs if job_id not in existing]
+
+
+def source_files(classes) -> List[str]:
+    """
+        The source files of the packages defining the classes (and their
+        bases): all the modules of the top-level package, or only the
+        module if it is not in a package.
+    """
+    filenames = set()
+    packages = set()
+    for cls in classes:
+        for base in inspect.getmro(cls):
+            package = base.__module__.split('.')[0]
+            if package in packages:
+                continue
+            packages.add(package)
+            module = sys.modules.get(package)
+            if module is not None and hasattr(module, '__path__'):
+                for dirname in module.__path__:
+                    filenames.update(package_files(dirname))
+                continue
+            try:
+                filenames.add(os.path.realpath(inspect.getsourcefile(base)))
+            except TypeError:
+                # builtin
+                pass
+    return sorted(filenames)
+
+
+def package_files(dirname: str) -> List[str]:
+    """ The Python files in the directory of a package and its subpackages. """
+    filenames = []
+    for root, dirs, files in os.walk(dirname):
+        dirs[:] = [d for d in dirs if d != '__pycache__']
+        for f in files:
+            if f.endswith('.py'):
+                filenames.append(os.path.realpath(os.path.join(root, f)))
+    return filenames
+
+
+def definition_key(qapp_class, options, sources: List[str]) -> str:
+    h = hashlib.sha1()
+    h.update(('%s.%s\n' % (qapp_class.__module__, qapp_class.__qualname__)).encode())
+    values = dict((k, v) for k, v in options._values.items() if k not in OPTIONS_NOT_IN_KEY)
+    h.update(repr(sorted(values.items())).encode())
+    h.update(repr(options.get_extra()).encode())
+    for filename in sources:
+        h.update(filename.encode())
+        try:
+            with open(filename, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+        except IOError:
+            h.update(b'missing')
+    return h.hexdigest()
@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+from typing import List, Optional
+
+__all__ = [
+    'DefinitionProfile',
+    'format_definition_profile',
+    'write_definition_profile',
+]
+
+
+class DefinitionProfile:
+    """
+        Statistics of the definition of the jobs, for one context
+        (see QuickApp.go(), option --profile_definition).
+
+        For a context created by child(), the time is the one spent in its
+        comp() calls, plus the one of its children; for the root and for
+        the subtasks (call_recursive()), it is the wall time of the whole
+        definition, minus the time taken by the profiling itself. The bytes
+        are the size of the job arguments, as stored by compmake.
+    """
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        # 'app', 'subtask' or 'context'
+        self.kind = kind
+        self.n_comp = 0
+        self.nbytes = 0
+        self.comp_time = 0.0
+        # time spent reading the size of the jobs (not in comp_time)
+        self.overhead = 0.0
+        # wall time of the definition, for 'app' and 'subtask'
+        self.span: Optional[float] = None
+        self.children: List[DefinitionProfile] = []
+
+    def child(self, name: str, kind: str = 'context') -> "DefinitionProfile":
+        c = DefinitionProfile(name, kind)
+        self.children.append(c)
+        return c
+
+    def add_jobs(self, n: int, delta: float, nbytes: int, overhead: float = 0.0) -> None:
+        self.n_comp += n
+        self.comp_time += delta
+        self.nbytes += nbytes
+        self.overhead += overhead
+
+    def total_time(self) -> float:
+        if self.span is not None:
+            return max(0.0, self.span - self.total_overhead())
+        return self.comp_time + sum(c.total_time() for c in self.children)
+
+    def total_overhead(self) -> float:
+        return self.overhead + sum(c.total_overhead() for c in self.children)
+
+    def total_comp(self) -> int:
+        return self.n_comp + sum(c.total_comp() for c in self.children)
+
+    def total_bytes(self) -> int:
+        return self.nbytes + sum(c.total_bytes() for c in self.children)
+
+    def to_dict(self) -> dict:
+        return dict(name=self.name, kind=self.kind,
+                    time=self.total_time(), n_comp=self.total_comp(),
+                    nbytes=self.total_bytes(),
+                    own=dict(time=self.comp_time, n_comp=self.n_comp, nbytes=self.nbytes),
+                    children=[c.to_dict() for c in self.children])
+
+
+def format_definition_profile(profile: DefinitionProfile, min_fraction: float = 0.0) -> str:
+    """
+        Renders the tree as text, one line per context, with the
+        totals of the subtree. Contexts taking less than ``min_fraction``
+        of the total time are omitted.
+    """
+    total = max(profile.total_time(), 1e-9)
+    lines = ['%8s %6s %9s %11s  %s' % ('time', '%', 'comp()', 'bytes', 'context')]
+
+    def visit(p: DefinitionProfile, depth: int):
+        t = p.total_time()
+        if depth > 0 and t / total < min_fraction:
+            return
+        name = p.name if p.kind == 'context' else '%s (%s)' % (p.name, p.kind)
+        lines.append('%7.2fs %5.1f%% %9d %11d  %s%s'
+                     % (t, 100 * t / total, p.total_comp(), p.total_bytes(),
+                        '  ' * depth, name))
+        for c in sorted(p.children, key=lambda c: -c.total_time()):
+            visit(c, depth + 1)
+
+    visit(profile, 0)
+    return '\n'.join(lines) + '\n'
+
+
+def write_definition_profile(profile: DefinitionProfile, output_dir: str) -> List[str]:
+    """
+        Writes definition-profile.json and definition-profile.txt
+        in output_dir; returns the filenames.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    fn_json = os.path.join(output_dir, 'definition-profile.json')
+    fn_txt = os.path.join(output_dir, 'definition-profile.txt')
+    for filename, contents in [(fn_json, json.dumps(profile.to_dict(), indent=1)),
+                               (fn_txt, format_definition_profile(profile))]:
+        tmp = '%s.tmp-%s-%s' % (filename, socket.gethostname(), os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(contents)
+        os.replace(tmp, filename)
+    return [fn_json, fn_txt]
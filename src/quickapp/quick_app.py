@@ -1,6 +1,7 @@
 import os
 import shutil
 import sys
+import time
 import traceback
 from abc import abstractmethod
 from typing import List
@@ -16,6 +17,9 @@ from decent_params.utils import UserError, wrap_script_entry_point
 from quickapp import QUICKAPP_COMPUTATION_ERROR, logger
 
 from .compmake_context import CompmakeContext, context_get_merge_data
+from .definition_cache import DefinitionCache, jobs_missing
+from .definition_profile import (DefinitionProfile, format_definition_profile,
+                                 write_definition_profile)
 from .exceptions import QuickAppException
 from .quick_app_base import QuickAppBase
 from .report_manager import _dynreports_create_index
@@ -63,6 +67,15 @@ class QuickApp(QuickAppBase):
         # params.add_flag('compmake', help='Activates compmake caching (if app is such that set_default_reset())', group=g)
 
         params.add_flag('console', help='Use Compmake console', group=g)
+        params.add_flag('profile_definition',
+                        help='Write the time, number of jobs and bytes of the definition '
+                             'of each context to definition-profile.{json,txt}',
+                        group=g)
+        params.add_flag('definition_cache',
+                        help='Skip the definition of the jobs if the options and the '
+                             'code of the packages of the QuickApp classes did not change '
+                             'since the last run (a run without this flag removes the cache)',
+                        group=g)
 
         params.add_string('command', short='c',
                           help="Command to pass to compmake for batch mode",
@@ -139,22 +152,48 @@ class QuickApp(QuickAppBase):
                              output_dir=output_dir)
         read_rc_files(oc)
 
-        original = oc.get_comp_prefix()
-        self.define_jobs_context(qc)
-        oc.comp_prefix(original)
-
-        merged = context_get_merge_data(qc)
+        definition_cache = DefinitionCache(output_dir)
+        jobs = None
+        if options.definition_cache:
+            jobs = definition_cache.load(type(self), options)
+            if jobs is not None and jobs_missing(db, jobs):
+                jobs = None
+        else:
+            definition_cache.invalidate()
 
-        # Only create the index job if we have reports defined
-        # or some branched context (which might create reports)
-        has_reports = len(qc.get_report_manager().allreports) > 0
-        has_branched = qc.has_branched()
-        if has_reports or has_branched:
-            # self.info('Creating reports')
-            oc.comp_dynamic(_dynreports_create_index, merged)
+        if jobs is not None:
+            self.logger.info('Jobs unchanged since the last run (%d jobs).' % len(jobs))
+            oc.reset_jobs_defined_in_this_session(jobs)
         else:
-            pass
-            # self.info('Not creating reports.')
+            # the QuickApp classes involved; see call_recursive()
+            self._definition_classes = [type(self)]
+            if options.profile_definition:
+                profile = DefinitionProfile(type(self).__name__, 'app')
+                qc.set_definition_profile(profile)
+                t0 = time.time()
+            original = oc.get_comp_prefix()
+            self.define_jobs_context(qc)
+            oc.comp_prefix(original)
+
+            merged = context_get_merge_data(qc)
+
+            # Only create the index job if we have reports defined
+            # or some branched context (which might create reports)
+            has_reports = qc.get_report_manager().num_reports() > 0
+            has_branched = qc.has_branched()
+            if has_reports or has_branched:
+                # self.info('Creating reports')
+                oc.comp_dynamic(_dynreports_create_index, merged)
+            else:
+                pass
+                # self.info('Not creating reports.')
+
+            if options.profile_definition:
+                profile.span = time.time() - t0
+                filenames = write_definition_profile(profile, output_dir)
+                msg = 'Definition profile (written to %s):\n' % filenames[0]
+                msg += format_definition_profile(profile, min_fraction=0.01)
+                self.logger.info(msg)
 
         ndefined = len(oc.get_jobs_defined_in_this_session())
         if ndefined == 0:
@@ -162,6 +201,9 @@ class QuickApp(QuickAppBase):
             msg = 'No jobs defined.'
             raise ValueError(msg)
         else:
+            if options.definition_cache and jobs is None:
+                definition_cache.save(type(self), options, self._definition_classes,
+                                      oc.get_jobs_defined_in_this_session())
             if options.console:
                 oc.compmake_console()
                 return 0
@@ -213,6 +255,11 @@ This means that if you call it second time with the same arguments,
         instance = cmd_class()
         instance.set_parent(self)
         is_quickapp = isinstance(instance, QuickApp)
+        root = self
+        while root.get_qapp_parent() is not None:
+            root = root.get_qapp_parent()
+        if getattr(root, '_definition_classes', None) is not None:
+            root._definition_classes.append(cmd_class)
 
         try:
             # we are already in a context; just define jobs
@@ -224,6 +271,11 @@ This means that if you call it second time with the same arguments,
                                           separate_report_manager=separate_report_manager,
                                           add_job_prefix=add_job_prefix)  # XXX
 
+            profile = child_context.get_definition_profile()
+            if profile is not None:
+                profile.kind = 'subtask'
+                t0 = time.time()
+
             if isinstance(args, list):
                 instance.set_options_from_args(args)
             elif isinstance(args, dict):
@@ -238,8 +290,11 @@ This means that if you call it second time with the same arguments,
                 instance.context = child_context
                 res = instance.define_jobs_context(child_context)
 
+            if profile is not None:
+                profile.span = time.time() - t0
+
             # Add his jobs to our list of jobs
-            context._jobs.update(child_context.all_jobs_dict())
+            context.add_jobs_of(child_context)
             return res
 
         except Exception as e:
@@ -1,6 +1,9 @@
+import hashlib
 import os
 import time
+import zlib
 from pprint import pformat
+from typing import List
 
 import numpy as np
 
@@ -13,7 +16,13 @@ from reprep import Report
 from reprep.utils import frozendict2
 from zuper_commons.text import natsorted
 from . import logger
-from .rm import write_report_single
+from .rm import (BlobStore, HTMLWriter, IndexJournal, IndexLock, IndexOptions,
+                 IndexRecords, RealpathCache, ReportHashSidecar, ReportManifest,
+                 ReportRegistry, ReportsDelta, VariationTable, index_reports_sharded,
+                 load_report, release_linked_files, report_content_hash,
+                 resolve_shared, save_latest_shared_reports, save_report_indexed,
+                 save_shared_reports, write_gzip_sibling, write_index_manifest,
+                 write_index_viewer, write_report_single)
 
 __all__ = [
     'ReportManager',
@@ -22,47 +31,105 @@ __all__ = [
 
 class ReportManager:
 
-    def __init__(self, context, outdir, index_filename=None):
-        # TODO: remove context
-        self.context = context
+    def __init__(self, context, outdir, index_filename=None, index_debounce=None,  # @UnusedVariable
+                 shared_root=None):
+        """
+            :param shared_root: directory for the files shared by all the
+                report managers of the application: the static files of
+                reprep and the blob store (see set_blob_store()).
+                Defaults to ``outdir``.
+        """
+        # The context is not kept: the ReportManager is pickled in the
+        # jobs that merge the reports of the branches.
         self.outdir = outdir
+        if shared_root is None:
+            shared_root = outdir
+        self.shared_root = shared_root
         if index_filename is None:
             index_filename = os.path.join(self.outdir, 'report_index.html')
         self.index_filename = index_filename
-        from reprep.report_utils import StoreResults
-        self.allreports = StoreResults()
-        self.allreports_filename = StoreResults()
-
-        # report_type -> set of keys necessary
-        self._report_types_format = {}
+        # key -> (job id, filename), and the format of each report type
+        self._registry = ReportRegistry()
 
         self.html_resources_prefix = ''
 
+        self.index_options = IndexOptions()
+        if index_debounce is not None:
+            self.index_options.debounce = index_debounce
+
         # check if we are called more than once; would be a bug
         self.index_job_created = False
 
-        self.static_dir = os.path.join(self.outdir, 'reprep-static')
+        # see set_write_batches()
+        self.write_batch_size = None
+        self.write_batch_by = 'type'
+
+        # see set_tree_dump()
+        self.tree_dump = 'inline'
+
+        # see set_report_layout()
+        self.report_layout = 'flat'
+        self.report_layout_levels = 2
+
+        # see set_report_storage()
+        self.report_storage = 'pickle'
+
+        self.static_dir = os.path.join(self.shared_root, 'reprep-static')
+        # see set_blob_store()
+        self.blobs_dir = None
+        # where the report -> filename mapping is shared with the write jobs
+        self.shared_dir = os.path.join(self.outdir, 'quickapp-shared')
+
+    @property
+    def allreports(self):
+        """ A new StoreResults: key -> Promise of the report. """
+        from reprep.report_utils import StoreResults
+        res = StoreResults()
+        for key, job_id, _ in self._registry.items():
+            res[key] = Promise(job_id)
+        return res
+
+    @property
+    def allreports_filename(self):
+        """ A new StoreResults: key -> filename of the report. """
+        from reprep.report_utils import StoreResults
+        res = StoreResults()
+        for key, _, filename in self._registry.items():
+            res[key] = filename
+        return res
+
+    def num_reports(self) -> int:
+        return len(self._registry)
 
     def merge(self, other: "ReportManager") -> None:
         assert isinstance(other, ReportManager)
         """ Merges into this scructure the data from another reportmanager. """
-        # print('I have: %d reports' % len(self.allreports))
-        # print('merging with another with %d reports' % len(other.allreports))
-
-        for key in other.allreports:
-            report = other.allreports[key]
+        for key, job_id, filename in other._registry.items():
+            self._add_checked(key, job_id, filename)
 
-            if key in self.allreports:
-                selfreport = self.allreports[key]
+    def get_delta(self, since: int = 0) -> ReportsDelta:
+        """
+            Returns the reports added after the first ``since`` ones
+            (see :py:func:`context_get_merge_data`).
+        """
+        delta = ReportsDelta()
+        for key, job_id, filename in self._registry.items(since):
+            delta.add(key, job_id, filename)
+        return delta
+
+    def apply_delta(self, delta: ReportsDelta) -> None:
+        """ Adds the reports in the delta; like merge(). """
+        for key, job_id, filename in delta.items():
+            self._add_checked(key, job_id, filename)
+
+    def _add_checked(self, key, job_id: str, filename: str) -> None:
+        if key in self._registry:
+            self_job_id = self._registry.get_job_id(key)
+            if job_id != self_job_id:
                 msg = 'Found duplicate report %r' % key
-                msg += ' jobs %s and %s' % (report, selfreport)
-                # print(msg)
-                if report.job_id != selfreport.job_id:
-                    raise ValueError(msg)
-
-            filename = other.allreports_filename[key]
-            self.allreports[key] = report
-            self.allreports_filename[key] = filename
+                msg += ' jobs %s and %s' % (job_id, self_job_id)
+                raise ValueError(msg)
+        self._registry.add(key, job_id, filename)
 
     def set_html_resources_prefix(self, prefix):
         """
@@ -72,21 +139,133 @@ class ReportManager:
         """
         self.html_resources_prefix = prefix + '-'
 
-    def _check_report_format(self, report_type, **kwargs):
-        keys = sorted(list(kwargs.keys()))
-        # print('report %r %r' % (report_type, keys))
-        if not report_type in self._report_types_format:
-            self._report_types_format[report_type] = keys
+    def set_index_debounce(self, seconds: float):
+        """
+            Sets the minimum interval between two regenerations of the
+            index by the write jobs. Use 0 to regenerate it after every report.
+        """
+        self.index_options.debounce = seconds
+
+    def set_index_mode(self, mode: str, page_size: int = None):
+        """
+            Sets how the index is written: 'single' (one page, the default),
+            'sharded' (a root page plus paginated pages for each report
+            type and value of its top-level field) or 'client' (a static
+            page that renders the manifest in the browser).
+        """
+        self.index_options.set_mode(mode, page_size)
+
+    def set_index_manifest(self, manifest_format: str = 'ndjson'):
+        """
+            Also writes a machine-readable manifest of the reports next to
+            the index, in ``<index>-manifest.json`` or ``.ndjson``.
+            Use None to disable it.
+        """
+        self.index_options.set_manifest_format(manifest_format)
+
+    def set_gzip(self, enabled: bool = True):
+        """
+            Also writes a compressed copy (``.html.gz``) next to every report
+            and index page, so that a static server can send it as is.
+        """
+        self.index_options.gzip = enabled
+
+    def set_index_aggregation(self, enabled: bool = True):
+        """
+            The write jobs only leave a completion record for each report,
+            and the index is written by a single job at a time, under a
+            lock (see IndexOptions). Use with parmake or on NFS.
+        """
+        self.index_options.aggregate = enabled
+
+    def set_blob_store(self, enabled: bool = True):
+        """
+            Keeps the resources of the reports (figures, etc.) in a
+            content-addressed store in ``<shared_root>/reprep-blobs``;
+            the files in the resources directory of each report become
+            hard links to it, so identical files are stored only once.
+        """
+        if enabled:
+            self.blobs_dir = os.path.join(self.shared_root, 'reprep-blobs')
         else:
-            keys0 = self._report_types_format[report_type]
-            if not keys == keys0:
-                msg = 'Report %r %r' % (report_type, keys)
-                msg += '\ndoes not match previous format %r' % keys0
-                raise ValueError(msg)
+            self.blobs_dir = None
+
+    def set_write_batches(self, batch_size: int, batch_by: str = 'type'):
+        """
+            Writes the reports in batches of about ``batch_size`` reports
+            per job, instead of one job per report. The batches never mix
+            reports of different groups: ``batch_by`` is either 'type'
+            (the report type) or 'prefix' (the prefix of the id of the job
+            creating the report). Use None to go back to one job per report.
+        """
+        if batch_size is not None and batch_size < 1:
+            msg = 'Invalid batch size %r.' % batch_size
+            raise ValueError(msg)
+        if not batch_by in WRITE_BATCH_BY:
+            msg = 'Invalid batch_by %r; expected one of %s.' % (batch_by, WRITE_BATCH_BY)
+            raise ValueError(msg)
+        self.write_batch_size = batch_size
+        self.write_batch_by = batch_by
+
+    def set_tree_dump(self, mode: str):
+        """
+            Sets how the tree of each report (Report.format_tree()) is saved:
+            'inline' (a hidden <pre> in the page, the default), 'sidecar'
+            (a separate ``.tree.txt`` file, loaded by the page on demand)
+            or 'off'.
+        """
+        if not mode in TREE_DUMP_MODES:
+            msg = 'Invalid tree dump mode %r; expected one of %s.' % (mode, TREE_DUMP_MODES)
+            raise ValueError(msg)
+        self.tree_dump = mode
+
+    def set_report_layout(self, layout: str, levels: int = 2):
+        """
+            Sets where the report files are written, inside the directory
+            of their report type: 'flat' (all in that directory, the
+            default) or 'hashed' (in ``levels`` levels of subdirectories
+            named after the hash of the filename, such as ``3f/a2/``),
+            for report types with very many reports.
+
+            It must be called before adding the reports.
+        """
+        if not layout in REPORT_LAYOUTS:
+            msg = 'Invalid report layout %r; expected one of %s.' % (layout, REPORT_LAYOUTS)
+            raise ValueError(msg)
+        if levels < 1:
+            msg = 'Invalid number of levels %r.' % levels
+            raise ValueError(msg)
+        if self.num_reports():
+            msg = 'The report layout must be set before adding the reports.'
+            raise ValueError(msg)
+        self.report_layout = layout
+        self.report_layout_levels = levels
+
+    def set_report_storage(self, storage: str):
+        """
+            Sets how the reports are passed to the jobs that use them:
+            'pickle' (the Report returned by the job, the default) or
+            'indexed': each report is saved by an extra job in
+            ``quickapp-shared/reports/``, in a format that can load single
+            parts (see IndexedReport), and the jobs get a handle to it.
+
+            With 'indexed', get_report() returns the promise of the
+            IndexedReport. It must be called before adding the reports.
+        """
+        if not storage in REPORT_STORAGES:
+            msg = 'Invalid report storage %r; expected one of %s.' % (storage, REPORT_STORAGES)
+            raise ValueError(msg)
+        if self.num_reports():
+            msg = 'The report storage must be set before adding the reports.'
+            raise ValueError(msg)
+        self.report_storage = storage
+
+    def _check_report_format(self, report_type, **kwargs):
+        self._registry.check_format(report_type, kwargs)
 
     def get(self, report_type, **kwargs):
         key = frozendict2(report=report_type, **kwargs)
-        return self.allreports[key]
+        return Promise(self._registry.get_job_id(key))
 
     def add(self, context, report, report_type: str, **kwargs):
         """
@@ -113,14 +292,12 @@ class ReportManager:
 
         key = frozendict2(report=report_type, **kwargs)
 
-        if key in self.allreports:
+        if key in self._registry:
             msg = 'Already added report for %s' % key
-            msg += '\n its values is %s' % self.allreports[key]
+            msg += '\n its values is %s' % Promise(self._registry.get_job_id(key))
             msg += '\n new value would be %s' % report
             raise ValueError(msg)
 
-        self.allreports[key] = report
-
         report_type_sane = report_type.replace('_', '')
 
         key_no_report = dict(**key)
@@ -130,8 +307,18 @@ class ReportManager:
             basename += '-' + basename_from_key(key_no_report)
 
         dirname = os.path.join(self.outdir, report_type_sane)
+        if self.report_layout == 'hashed':
+            dirname = os.path.join(dirname, *hashed_subdirs(basename, self.report_layout_levels))
         filename = os.path.join(dirname, basename)
-        self.allreports_filename[key] = filename + '.html'
+
+        if self.report_storage == 'indexed':
+            storage_filename = os.path.join(self.shared_dir, 'reports',
+                                            report.job_id + '.qareport')
+            storage_job_id = jobid_minus_prefix(context, report.job_id + '-indexed')
+            report = context.comp(save_report_indexed, report, storage_filename,
+                                  job_id=storage_job_id)
+
+        self._registry.add(key, report.job_id, filename + '.html')
 
         write_singles = False
 
@@ -163,13 +350,22 @@ class ReportManager:
                              job_id=write_job_id)
 
     # @contract(context=Context)
-    def create_index_job(self, context: Context):
+    def create_index_job(self, context: Context, batch_size=None, batch_by=None):
+        """
+            Creates the jobs writing the reports and the index.
+
+            ``batch_size`` and ``batch_by`` override the values given
+            with set_write_batches().
+        """
+        if batch_size is not None or batch_by is not None:
+            self.set_write_batches(batch_size=batch_size or self.write_batch_size,
+                                   batch_by=batch_by or self.write_batch_by)
         if self.index_job_created:
             msg = 'create_index_job() was already called once'
             raise ValueError(msg)
         self.index_job_created = True
 
-        if not self.allreports:
+        if not self.num_reports():
             # no report necessary
             return
 
@@ -179,35 +375,53 @@ class ReportManager:
                           html_resources_prefix=self.html_resources_prefix,
                           index_filename=self.index_filename,
                           static_dir=self.static_dir,
+                          index_options=self.index_options,
+                          shared_dir=self.shared_dir,
+                          batch_size=self.write_batch_size,
+                          batch_by=self.write_batch_by,
+                          tree_dump=self.tree_dump,
+                          blobs_dir=self.blobs_dir,
                           suffix='write')
 
 
-def create_write_jobs(context, allreports_filename, allreports,
-                      html_resources_prefix, index_filename, suffix,
-                      static_dir):
-    # Do not pass as argument, it will take lots of memory!
-    # XXX FIXME: there should be a way to make this update or not
-    # otherwise new report do not appear
-    optimize_space = False
-    if optimize_space and len(allreports_filename) > 100:
-        allreports_filename = context.comp_store(allreports_filename, 'allfilenames')
-    else:
-        allreports_filename = allreports_filename
+WRITE_BATCH_BY = ('type', 'prefix')
+TREE_DUMP_MODES = ('off', 'inline', 'sidecar')
+REPORT_LAYOUTS = ('flat', 'hashed')
+REPORT_STORAGES = ('pickle', 'indexed')
 
-    type2reports = sort_by_type(allreports_filename)
 
+def create_write_jobs(context, allreports_filename, allreports,
+                      html_resources_prefix, index_filename, suffix,
+                      static_dir, index_options=None, shared_dir=None,
+                      batch_size=None, batch_by='type', tree_dump='inline',
+                      blobs_dir=None):
+    # Do not pass the mapping as argument to every job, it would be pickled
+    # N times: it is saved once in shared_dir (content-addressed, so that
+    # the final index is redone when reports are added). The write jobs
+    # get only the links of their reports, and for the intermediate
+    # versions of the index a reference to the last mapping, so that
+    # a new report does not invalidate them all.
+    if shared_dir is None:
+        shared_dir = os.path.join(os.path.dirname(static_dir), 'quickapp-shared')
+    shared = save_shared_reports(shared_dir, allreports_filename)
+    latest = save_latest_shared_reports(shared)
+    shared_reports = shared.load()
+    type2reports = shared_reports.type2reports()
+    similarity = shared_reports.similarity()
+
+    write_jobs = []
+    # group -> list of (report_nid, write), for batching
+    groups = {}
     for key in allreports:
         job_report = allreports[key]
         filename = allreports_filename[key]
 
-        write_job_id = jobid_minus_prefix(context, job_report.job_id + '-' + suffix)
-
         # Create the links to report of the same type
         report_type = key['report']
-        other_reports_same_type = type2reports[report_type]
+        variations = shared_reports.variations(report_type)
 
         # find the closest report for different type
-        others = find_others(type2reports, key)
+        others = find_others(type2reports, key, similarity=similarity)
 
         report_type_sane = report_type.replace('_', '')
         report_nid = html_resources_prefix + report_type_sane
@@ -219,16 +433,79 @@ def create_write_jobs(context, allreports_filename, allreports,
 
         # XXX: not sure why this was here in the first place
 
-        context.comp(write_report_and_update,
-                     report=job_report, report_nid=report_nid,
-                     report_html=filename, all_reports=allreports_filename,
-                     index_filename=index_filename,
-                     write_pickle=False,
+        write = dict(report=job_report, report_nid=report_nid,
+                     report_html=filename,
                      this_report=key,
-                     static_dir=static_dir,
-                     other_reports_same_type=other_reports_same_type,
+                     other_reports_same_type=variations.restrict(key),
                      most_similar_other_type=others,
-                     job_id=write_job_id)
+                     report_job_id=job_report.job_id)
+
+        if batch_size is not None:
+            if batch_by == 'type':
+                group = report_type
+            else:
+                group = job_report.job_id.rsplit('-', 1)[0]
+            groups.setdefault(group, []).append((report_nid, write))
+            continue
+
+        write_job_id = jobid_minus_prefix(context, job_report.job_id + '-' + suffix)
+        job = context.comp(write_report_and_update,
+                           all_reports=latest,
+                           index_filename=index_filename,
+                           write_pickle=False,
+                           static_dir=static_dir,
+                           index_options=index_options,
+                           tree_dump=tree_dump,
+                           blobs_dir=blobs_dir,
+                           job_id=write_job_id, **write)
+        write_jobs.append(job)
+
+    for group in natsorted(groups):
+        for batch in make_write_batches(groups[group], batch_size):
+            # named after its last report: deterministic, and it changes
+            # only if this batch is split by a new report
+            last_nid = batch[-1][0]
+            write_job_id = jobid_minus_prefix(context, '%s-batch-%s' % (suffix, last_nid))
+            job = context.comp(write_report_batch,
+                               writes=[write for _, write in batch],
+                               all_reports=latest,
+                               index_filename=index_filename,
+                               static_dir=static_dir,
+                               index_options=index_options,
+                               tree_dump=tree_dump,
+                               blobs_dir=blobs_dir,
+                               job_id=write_job_id)
+            write_jobs.append(job)
+
+    # The write jobs only update the index every so often;
+    # this one writes the final version once all reports are done.
+    context.comp(write_index_final, reports=shared,
+                 index_filename=index_filename,
+                 index_options=index_options,
+                 extra_dep=write_jobs,
+                 job_id='index-' + suffix)
+
+
+def make_write_batches(items, batch_size):
+    """
+        Splits the list of (report_nid, x) in batches of about ``batch_size``
+        elements, ordered by report_nid.
+
+        The boundaries depend only on the nids (a batch ends after each nid
+        whose hash is 0 modulo batch_size), not on the position in the list:
+        adding or removing a report changes only the batch containing it.
+    """
+    nid2item = dict(items)
+    batches = []
+    current = []
+    for nid in natsorted(nid2item):
+        current.append((nid, nid2item[nid]))
+        if zlib.crc32(nid.encode('utf-8')) % batch_size == 0:
+            batches.append(current)
+            current = []
+    if current:
+        batches.append(current)
+    return batches
 
 
 def jobid_minus_prefix(context, want):
@@ -245,7 +522,8 @@ def jobid_minus_prefix(context, want):
 
 
 def sort_by_type(allreports_filename):
-    type2reports = {}
+    """ Returns report type -> StoreResults, with the types in natural order. """
+    groups = {}
     for report_type, xs in allreports_filename.groups_by_field_value('report'):
         fields = xs.remove_field('report')
         # print(fields)
@@ -253,12 +531,20 @@ def sort_by_type(allreports_filename):
         res = StoreResults()
         for k, v in list(fields.items()):
             res[k] = v
-        type2reports[report_type] = res
+        groups[report_type] = res
+    # (the order of the links to the other types does not depend on the hash seed)
+    type2reports = {}
+    for report_type in natsorted(groups):
+        type2reports[report_type] = groups[report_type]
     return type2reports
 
 
-def find_others(type2reports, key):
-    """ find the closest report for different type """
+def find_others(type2reports, key, similarity=None):
+    """
+        find the closest report for different type
+
+        :param similarity: optional SimilarityIndex built from type2reports.
+    """
     report_type = key['report']
 
     key = dict(**key)
@@ -268,7 +554,10 @@ def find_others(type2reports, key):
     for other_type, other_type_reports in list(type2reports.items()):
         if other_type == report_type:
             continue
-        best = get_most_similar(other_type_reports, key)
+        if similarity is not None:
+            best = similarity.most_similar(other_type, key)
+        else:
+            best = get_most_similar(other_type_reports, key)
         if best is not None:
             others.append((other_type, best, other_type_reports[best]))
 
@@ -299,37 +588,39 @@ def get_most_similar(reports_different_type, key):
 
 def create_links_html(this_report, other_reports_same_type, index_filename,
                       most_similar_other_type):
-    check_isinstance(other_reports_same_type, 'StoreResults')
     '''
     :param this_report: dictionary with the keys describing the report
-    :param other_reports_same_type: StoreResults -> filename
+    :param other_reports_same_type: StoreResults -> filename,
+        or the VariationTable built from it
     :returns: html string describing the link
     '''
+    other_reports_same_type = as_variation_table(other_reports_same_type)
 
     def rel_link(f):  # (this is FROM f0 to f) --- trust me, it's ok
-        f0 = other_reports_same_type[this_report]
+        f0 = other_reports_same_type.filename(this_report)
         rl = os.path.relpath(f, os.path.dirname(f0))
         return rl
 
-    s = ""
+    out = HTMLWriter()
+    out.write('<div style="margin-left: 1em;">')
 
     # create table by cols
     table = create_links_html_table(this_report, other_reports_same_type)
 
-    s += "<p><a href='%s'>All report</a></p>" % rel_link(index_filename)
+    out.write("<p><a href='%s'>All report</a></p>" % rel_link(index_filename))
 
-    s += "<table class='variations'>"
-    s += "<thead><tr>"
+    out.write("<table class='variations'>")
+    out.write("<thead><tr>")
     for field, _ in table:
-        s += "<th>%s</th>" % field
-    s += "</tr></thead>"
+        out.write("<th>%s</th>" % field)
+    out.write("</tr></thead>")
 
-    s += "<tr>"
+    out.write("<tr>")
 
     add_invalid_links = True
 
     for field, variations in table:
-        s += "<td>"
+        out.write("<td>")
 
         MAX_VARIATIONS_EXPLICIT = 10
 
@@ -344,19 +635,19 @@ def create_links_html(this_report, other_reports_same_type, index_filename,
         if len(variations) > MAX_VARIATIONS_EXPLICIT:
             id_select = 'select-%s' % (field)
             onchange = 'onchange_%s' % (field)
-            s += "<select id='%s' onChange='%s()'>\n" % (id_select, onchange)
+            out.write("<select id='%s' onChange='%s()'>\n" % (id_select, onchange))
 
             for text, link in variations:
                 if link is not None:
-                    s += "<option value='%s'>%s</a> \n" % (link, text)
+                    out.write("<option value='%s'>%s</a> \n" % (link, text))
                 else:
                     if add_invalid_links:
-                        s += "<option value=''>%s</a> \n" % (text)
-                s += '<br/>'
+                        out.write("<option value=''>%s</a> \n" % (text))
+                out.write('<br/>')
 
-            s += '</select>\n'
+            out.write('</select>\n')
 
-            s += """         
+            out.write("""         
 <script>
     $(function(){
       // bind change event to select
@@ -369,21 +660,21 @@ def create_links_html(this_report, other_reports_same_type, index_filename,
       });
     });
 </script>
-""" % id_select
+""" % id_select)
 
         else:
             for text, link in variations:
                 if link is not None:
-                    s += "<a href='%s'> %s</a> " % (link, text)
+                    out.write("<a href='%s'> %s</a> " % (link, text))
                 else:
                     if add_invalid_links:
-                        s += "%s " % (text)
-                s += '<br/>\n'
+                        out.write("%s " % (text))
+                out.write('<br/>\n')
 
-        s += "</td>"
+        out.write("</td>")
 
-    s += "</tr>"
-    s += "</table>"
+    out.write("</tr>")
+    out.write("</table>")
 
     #     s += '<dl>'
     #     for other_type, most_similar, filename in most_similar_other_type:
@@ -392,74 +683,292 @@ def create_links_html(this_report, other_reports_same_type, index_filename,
     #     s += '</dl>'
 
     if most_similar_other_type:
-        s += '<p>Other report: '
+        out.write('<p>Other report: ')
         for other_type, _, filename in most_similar_other_type:
-            s += '<a href="%s">%s</a> ' % (rel_link(filename), other_type)
-        s += '</p>'
+            out.write('<a href="%s">%s</a> ' % (rel_link(filename), other_type))
+        out.write('</p>')
+
+    out.write('</div>')
+    return out.getvalue()
 
-    s = '<div style="margin-left: 1em;">' + s + '</div>'
-    return s
+
+def as_variation_table(other_reports_same_type):
+    if isinstance(other_reports_same_type, VariationTable):
+        return other_reports_same_type
+    from reprep.report_utils import StoreResults
+    check_isinstance(other_reports_same_type, StoreResults)
+    return VariationTable(other_reports_same_type)
 
 
 # @contract(returns="list( tuple(str, *))", other_reports_same_type=StoreResults)
 def create_links_html_table(this_report, other_reports_same_type):
     # Iterate over all keys (each key gets a column)
+    variations = as_variation_table(other_reports_same_type)
+    f0 = variations.filename(this_report)
 
     def rel_link(f):
-        # TODO: make it relative
-        f0 = other_reports_same_type[this_report]
         rl = os.path.relpath(f, os.path.dirname(f0))
         return rl
 
     cols = []
-    fieldnames = other_reports_same_type.field_names()
-    for field in fieldnames:
-        field_values = other_reports_same_type.field_values(field)
-        field_values = sorted(list(set(field_values)))
+    for field in variations.fields:
         col = []
-        for fv in field_values:
+        for fv, filename in variations.variations(this_report, field):
             if fv == this_report[field]:
                 # res = ('<span style="font-weight:bold">%s</span>' % str(fv), None)
                 res = (str(fv), None)
+            elif filename is None:
+                # the variation obtained by changing only one field value
+                # doesn't exist
+                res = ('%s (n/a)' % str(fv), None)
             else:
-                # this is the variation obtained by changing only one field value
-                variation = dict(**this_report)
-                variation[field] = fv
-                # if it doesn't exist:
-                if not variation in other_reports_same_type:
-                    res = ('%s (n/a)' % str(fv), None)
-                else:
-                    res = (fv, rel_link(other_reports_same_type[variation]))
+                res = (fv, rel_link(filename))
             col.append(res)
         cols.append((field, col))
     return cols
 
 
-# @contract(report=Report, report_nid='str', other_reports_same_type=StoreResults)
+# @contract(report=Report, report_nid='str', other_reports_same_type='StoreResults|VariationTable')
 def write_report_and_update(report, report_nid, report_html, all_reports, index_filename,
                             this_report,
                             other_reports_same_type,
                             most_similar_other_type,
                             static_dir,
-                            write_pickle=False):
+                            write_pickle=False,
+                            index_options=None,
+                            report_job_id=None,
+                            tree_dump='inline',
+                            blobs_dir=None):
+    timing = {}
+    html = write_report_with_links(report=report, report_nid=report_nid,
+                                   report_html=report_html,
+                                   index_filename=index_filename,
+                                   this_report=this_report,
+                                   other_reports_same_type=other_reports_same_type,
+                                   most_similar_other_type=most_similar_other_type,
+                                   static_dir=static_dir,
+                                   write_pickle=write_pickle,
+                                   tree_dump=tree_dump,
+                                   blobs_dir=blobs_dir,
+                                   timing=timing)
+
+    if index_options is None:
+        index_options = IndexOptions(debounce=0)
+
+    if index_options.gzip:
+        write_gzip_sibling(html)
+
+    journal = open_index_journal(index_filename, index_options)
+    journal.record(html, job_id=report_job_id, timing=timing)
+    update_index_if_due(journal, all_reports, index_options)
+
+
+def write_report_batch(writes, all_reports, index_filename, static_dir,
+                       index_options=None, tree_dump='inline', blobs_dir=None):
+    """
+        Writes several reports in one job; ``writes`` is a list of dicts
+        with the arguments of write_report_and_update() for each report.
+    """
+    if index_options is None:
+        index_options = IndexOptions(debounce=0)
+
+    journal = open_index_journal(index_filename, index_options)
+    for write in writes:
+        write = dict(write)
+        report_job_id = write.pop('report_job_id', None)
+        timing = {}
+        html = write_report_with_links(index_filename=index_filename,
+                                       static_dir=static_dir, tree_dump=tree_dump,
+                                       blobs_dir=blobs_dir, timing=timing, **write)
+        if index_options.gzip:
+            write_gzip_sibling(html)
+        journal.record(html, job_id=report_job_id, timing=timing)
+    update_index_if_due(journal, all_reports, index_options)
+
+
+def open_index_journal(index_filename, index_options):
+    """ Returns the IndexJournal, or the IndexRecords if the index is aggregated. """
+    if index_options.aggregate:
+        return IndexRecords(index_filename)
+    else:
+        return IndexJournal(index_filename)
+
+
+def update_index_if_due(journal, all_reports, index_options):
+    if not journal.index_is_due(index_options.debounce):
+        return
+    if index_options.aggregate:
+        lock = IndexLock(journal.index_filename)
+        if not lock.acquire(blocking=False):
+            # another job is writing it
+            return
+    else:
+        lock = None
+    try:
+        all_reports = resolve_shared(all_reports)
+        manifest = ReportManifest.from_journal(journal)
+        write_index(reports=all_reports, index_filename=journal.index_filename,
+                    manifest=manifest, index_options=index_options)
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def write_report_with_links(report, report_nid, report_html, index_filename,
+                            this_report, other_reports_same_type,
+                            most_similar_other_type, static_dir,
+                            write_pickle=False, tree_dump='inline', blobs_dir=None,
+                            timing=None):
+    """
+        Writes the report with the navigation links on top; returns its filename.
+
+        Nothing is written if the report and the links are the same as
+        the last time (see ReportHashSidecar), so that the mtime of the
+        file stays that of the last real change.
+
+        If ``timing`` is a dict, the seconds spent formatting the tree
+        and writing the HTML are stored in it ('tree' and 'html').
+
+        If ``blobs_dir`` is given, the resources of the report are moved
+        to the BlobStore there.
+    """
+    if timing is None:
+        timing = {}
+    timing.update(tree=0.0, html=0.0)
+    report = load_report(report)
     if not isinstance(report, Report):
         msg = 'Expected Report, got %s.' % describe_type(report)
         raise ValueError(msg)
 
+    other_reports_same_type = resolve_shared(other_reports_same_type)
+
     links = create_links_html(this_report, other_reports_same_type, index_filename,
                               most_similar_other_type=most_similar_other_type)
 
-    tree_html = '<pre style="display:none">%s</pre>' % report.format_tree()
+    report.nid = report_nid
+    # the tree is a function of the report: it is formatted only if needed
+    sha1 = report_content_hash(report, static_dir=static_dir,
+                               write_pickle=write_pickle, tree_dump=tree_dump,
+                               extra_html_body_start=links)
+    sidecar = ReportHashSidecar(report_html)
+    if sidecar.matches(sha1):
+        logger.debug('Report %s is unchanged' % friendly_path(report_html))
+        return report_html
+
+    sidecar.invalidate()
+    t0 = time.time()
+    tree_html = write_tree_dump(report, report_html, tree_dump)
+    timing['tree'] = time.time() - t0
 
     extras = dict(extra_html_body_start=links,
                   extra_html_body_end=tree_html)
 
-    report.nid = report_nid
+    # do not write through the links to the blobs (also those
+    # created by previous runs using the BlobStore)
+    resources_dir = os.path.splitext(report_html)[0]
+    release_linked_files(resources_dir)
+
+    t0 = time.time()
     html = write_report(report=report,
                         report_html=report_html,
                         static_dir=static_dir,
                         write_pickle=write_pickle, **extras)
-    index_reports(reports=all_reports, index=index_filename, update=html)
+    timing['html'] = time.time() - t0
+
+    if blobs_dir is not None:
+        BlobStore(blobs_dir).add_tree(resources_dir)
+    sidecar.save(sha1)
+    logger.debug('Report %s: tree %.3f s, html %.3f s'
+                 % (friendly_path(report_html), timing['tree'], timing['html']))
+    return html
+
+
+def write_tree_dump(report, report_html: str, mode: str) -> str:
+    """
+        Saves the tree of the report according to ``mode`` (see
+        ReportManager.set_tree_dump()); returns the HTML to add to the page.
+    """
+    if mode == 'off':
+        return ''
+    tree = report.format_tree()
+    if mode == 'inline':
+        return '<pre style="display:none">%s</pre>' % tree
+
+    filename = os.path.splitext(report_html)[0] + '.tree.txt'
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(filename, 'w') as f:
+        f.write(tree)
+    return TREE_DUMP_SIDECAR_HTML % dict(href=os.path.basename(filename))
+
+
+TREE_DUMP_SIDECAR_HTML = """
+<details class="report-tree">
+<summary>Report tree (<a href="%(href)s">text</a>)</summary>
+<pre></pre>
+</details>
+<script type="text/javascript">
+(function () {
+    var details = document.currentScript.previousElementSibling;
+    details.addEventListener('toggle', function () {
+        if (!details.open || details.loaded) return;
+        details.loaded = true;
+        fetch('%(href)s').then(function (response) { return response.text(); })
+            .then(function (text) { details.querySelector('pre').textContent = text; });
+    });
+})();
+</script>
+"""
+
+
+def write_index_final(reports, index_filename, index_options=None):
+    """ Writes the index once all the reports have been written. """
+    if index_options is None:
+        index_options = IndexOptions()
+    reports = resolve_shared(reports)
+    journal = open_index_journal(index_filename, index_options)
+    if index_options.aggregate:
+        lock = IndexLock(index_filename)
+        # waits for the write jobs still writing the index
+        lock.acquire()
+    else:
+        lock = None
+    try:
+        manifest = ReportManifest.from_journal(journal)
+        write_index(reports=reports, index_filename=index_filename,
+                    manifest=manifest, index_options=index_options)
+    finally:
+        if lock is not None:
+            lock.release()
+    journal.compact()
+
+    timings = [e['timing'] for e in manifest.entries() if 'timing' in e]
+    if timings:
+        logger.info('Wrote %d reports: %.1f s formatting trees, %.1f s writing HTML.'
+                    % (len(timings), sum(t['tree'] for t in timings),
+                       sum(t['html'] for t in timings)))
+
+
+def write_index(reports, index_filename, manifest, index_options):
+    """ Writes the index (and the manifest) in the format given by index_options. """
+    manifest_format = index_options.get_manifest_format()
+    if manifest_format is not None:
+        manifest_filename = write_index_manifest(reports=reports, index=index_filename,
+                                                 manifest=manifest,
+                                                 manifest_format=manifest_format,
+                                                 gzip=index_options.gzip)
+
+    if index_options.mode == 'client':
+        write_index_viewer(index=index_filename, manifest_filename=manifest_filename,
+                           gzip=index_options.gzip)
+    elif index_options.mode == 'sharded':
+        index_reports_sharded(reports=reports, index=index_filename,
+                              manifest=manifest, page_size=index_options.page_size,
+                              gzip=index_options.gzip)
+    else:
+        index_reports(reports=reports, index=index_filename, manifest=manifest,
+                      gzip=index_options.gzip)
 
 
 # @contract(report=Report, report_html='str')
@@ -480,13 +989,37 @@ def write_report(report, report_html, static_dir, write_pickle=False, **kwargs):
     return report_html
 
 
+INDEX_HTML_HEADER = """
+        <html>
+        <head>
+        <style type="text/css">
+        span.when { float: right; }
+        li { clear: both; }
+        a.self { color: black; text-decoration: none; }
+        </style>
+        </head>
+        <body>
+    """
+
+INDEX_HTML_FOOTER = '''
+    
+    </body>
+    </html>
+    
+    '''
+
+
 # @contract(reports=StoreResults, index=str)
-def index_reports(reports, index, update=None):  # @UnusedVariable
+def index_reports(reports, index, update=None, manifest=None, gzip=False):  # @UnusedVariable
     """
         Writes an index for the report to the file given.
         The special key "report" gives the report type.
 
         report[dict(report=...,param1=..., param2=...) ] => filename
+
+        If ``manifest`` (a ReportManifest) is given, the modification
+        times are taken from there instead of from the filesystem.
+        With ``gzip``, ``index.gz`` is written as well.
     """
     # print('Updating because of new report %s' % update)
 
@@ -496,84 +1029,37 @@ def index_reports(reports, index, update=None):  # @UnusedVariable
 
     # logger.info('Writing on %s' % friendly_path(index))
 
-    f = open(index, 'w')
+    out = HTMLWriter()
 
-    f.write("""
-        <html>
-        <head>
-        <style type="text/css">
-        span.when { float: right; }
-        li { clear: both; }
-        a.self { color: black; text-decoration: none; }
-        </style>
-        </head>
-        <body>
-    """)
-
-    mtime = lambda x: os.path.getmtime(x)
-    existing = list([x for x in list(reports.items()) if os.path.exists(x[1])])
-
-    # create order statistics
-    alltimes = np.array([mtime(b) for _, b in existing])
-
-    def order(filename):
-        """ returns between 0 and 1 the order statistics """
-        assert os.path.exists(filename)
-        histime = mtime(filename)
-        compare = (alltimes < histime)
-        return np.mean(compare * 1.0)
-
-    def style_order(order):
-        if order > 0.95:
-            return "color: green;"
-        if order > 0.9:
-            return "color: orange;"
-        if order < 0.5:
-            return "color: gray;"
-        return ""
+    out.write(INDEX_HTML_HEADER)
+
+    if manifest is None:
+        manifest = ReportManifest()
+    # filename -> mtime, only for the files that exist
+    mtimes = manifest.mtimes(reports.values())
+    existing = list([x for x in list(reports.items()) if x[1] in mtimes])
+
+    entries = IndexEntries(index, mtimes)
 
-    # @contract(k=dict, filename=str)
     def write_li(k, filename: str, element='li'):
-        desc = ",  ".join('%s = %s' % (a, b) for a, b in list(k.items()))
-        href = os.path.relpath(os.path.realpath(filename),
-                               os.path.dirname(os.path.realpath(index)))
-        if os.path.exists(filename):
-            when = duration_compact(time.time() - mtime(filename))
-            span_when = '<span class="when">%s ago</span>' % when
-            style = style_order(order(filename))
-            a = '<a href="%s">%s</a>' % (href, desc)
-        else:
-            # print('File %s does not exist yet' % filename)
-            style = ""
-            span_when = '<span class="when">missing</span>'
-            a = '<a href="%s">%s</a>' % (href, desc)
-        f.write('<%s style="%s">%s %s</%s>' % (element, style, a, span_when,
-                                               element))
+        out.write(entries.li(k, filename, element))
 
     # write the first 10
-    existing.sort(key=lambda x: (-mtime(x[1])))
-    nlast = min(len(existing), 10)
-    last = existing[:nlast]
-    f.write('<h2 id="last">Last %d report</h2>\n' % (nlast))
-
-    f.write('<ul>')
-    for i in range(nlast):
-        write_li(*last[i])
-    f.write('</ul>')
+    out.write(last_reports_html(existing, entries, nlast=10))
 
     if False:
         for report_type, r in reports.groups_by_field_value('report'):
-            f.write('<h2 id="%s">%s</h2>\n' % (report_type, report_type))
-            f.write('<ul>')
+            out.write('<h2 id="%s">%s</h2>\n' % (report_type, report_type))
+            out.write('<ul>')
             r = reports.select(report=report_type)
             items = list(r.items())
             items.sort(key=lambda x: str(x[0]))  # XXX use natsort
             for k, filename in items:
                 write_li(k, filename)
 
-            f.write('</ul>')
+            out.write('</ul>')
 
-    f.write('<h2>All report</h2>\n')
+    out.write('<h2>All report</h2>\n')
 
     try:
         sections = make_sections(reports)
@@ -592,78 +1078,185 @@ def index_reports(reports, index, update=None):  # @UnusedVariable
         field = sections['field']
         division = sections['division']
 
-        f.write('<ul>')
+        out.write('<ul>')
         sorted_values = natsorted(list(division.keys()))
         for value in sorted_values:
-            parents.append(value)
-            html_id = "-".join(map(str, parents))
+            # the path of values from the root
+            path = parents + [value]
+            html_id = "-".join(map(str, path))
             bottom = division[value]
             if bottom['type'] == 'sample':
                 d = {field: value}
                 if not bottom['key']:
                     write_li(k=d, filename=bottom['value'], element='li')
                 else:
-                    f.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n'
-                            % (html_id, html_id, field, value))
-                    f.write('<ul>')
+                    out.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n'
+                              % (html_id, html_id, field, value))
+                    out.write('<ul>')
                     write_li(k=bottom['key'], filename=bottom['value'], element='li')
-                    f.write('</ul>')
-                    f.write('</li>')
+                    out.write('</ul>')
+                    out.write('</li>')
             else:
-                f.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n'
-                        % (html_id, html_id, field, value))
+                out.write('<li> <p id="%s"><a class="self" href="#%s">%s = %s</a></p>\n'
+                          % (html_id, html_id, field, value))
 
-                write_sections(bottom, parents)
-                f.write('</li>')
-        f.write('</ul>')
+                write_sections(bottom, path)
+                out.write('</li>')
+        out.write('</ul>')
 
     write_sections(sections, parents=[])
 
-    f.write('''
-    
-    </body>
-    </html>
-    
-    ''')
-    f.close()
+    out.write(INDEX_HTML_FOOTER)
+    out.save(index, gzip_sibling=gzip)
+
+
+class IndexEntries:
+    """
+        Renders the entries (one per report) of an index page.
+
+        :param page: the filename of the page, links are relative to it
+        :param mtimes: filename -> mtime, for the reports that exist
+    """
+
+    def __init__(self, page: str, mtimes, now=None):
+        self.page_dir = os.path.dirname(os.path.realpath(page))
+        self.mtimes = mtimes
+        # create order statistics: the fraction of the other reports
+        # that are older than this one
+        self.orders = report_order_statistics(mtimes)
+        if now is None:
+            now = time.time()
+        self.now = now
+        self._realpaths = RealpathCache()
+
+    def realpath(self, filename: str) -> str:
+        return self._realpaths.realpath(filename)
+
+    def href(self, filename: str) -> str:
+        return os.path.relpath(self.realpath(filename), self.page_dir)
+
+    # @contract(k=dict, filename=str)
+    def li(self, k, filename: str, element='li') -> str:
+        desc = ",  ".join('%s = %s' % (a, b) for a, b in list(k.items()))
+        href = self.href(filename)
+        if filename in self.mtimes:
+            when = duration_compact(self.now - self.mtimes[filename])
+            span_when = '<span class="when">%s ago</span>' % when
+            style = style_order(self.orders[filename])
+            a = '<a href="%s">%s</a>' % (href, desc)
+        else:
+            # print('File %s does not exist yet' % filename)
+            style = ""
+            span_when = '<span class="when">missing</span>'
+            a = '<a href="%s">%s</a>' % (href, desc)
+        return '<%s style="%s">%s %s</%s>' % (element, style, a, span_when, element)
+
+
+def last_reports_html(existing, entries: IndexEntries, nlast: int) -> str:
+    """ Returns the list of the most recent reports among ``existing`` (key, filename). """
+    existing = sorted(existing, key=lambda x: (-entries.mtimes[x[1]]))
+    nlast = min(len(existing), nlast)
+    last = existing[:nlast]
+    s = ['<h2 id="last">Last %d report</h2>\n' % (nlast), '<ul>']
+    for k, filename in last:
+        s.append(entries.li(k, filename))
+    s.append('</ul>')
+    return ''.join(s)
+
+
+def style_order(order):
+    if order > 0.95:
+        return "color: green;"
+    if order > 0.9:
+        return "color: orange;"
+    if order < 0.5:
+        return "color: gray;"
+    return ""
+
+
+def report_order_statistics(mtimes):
+    """
+        Returns filename -> fraction (between 0 and 1) of the files
+        that are strictly older, computed with one sort.
+    """
+    filenames = list(mtimes)
+    if not filenames:
+        return {}
+    alltimes = np.array([mtimes[x] for x in filenames])
+    older = np.searchsorted(np.sort(alltimes), alltimes, side='left')
+    orders = older * 1.0 / len(alltimes)
+    return dict(zip(filenames, orders.tolist()))
 
 
 def make_sections(allruns, common=None):
-    # print allruns.keys()
+    """
+        Arranges the reports (StoreResults: key -> filename) in a tree,
+        splitting at each level on the field with the least choices.
+
+        Returns nested dict(type='division', field=..., division=...,
+        common=...), with leaves dict(type='sample', key=..., value=...).
+    """
     if common is None:
         common = {}
+    items = list(allruns.items())
+    fields = set()
+    for key in allruns:
+        fields.update(key)
+    return _make_sections(items, fields=sorted(fields), removed=(), common=common)
 
-    # print('Selecting %d with %s' % (len(allruns), common))
 
-    if len(allruns) == 1:
-        key = list(allruns.keys())[0]
-        value = allruns[key]
-        return dict(type='sample', common=common, key=key, value=value)
+_missing = object()
 
-    fields_size = [(field, len(list(allruns.groups_by_field_value(field))))
-                   for field in allruns.field_names_in_all_keys()]
 
-    # Now choose the one with the least choices
-    fields_size.sort(key=lambda x: x[1])
+def _make_sections(items, fields, removed, common):
+    """
+        Builds one level of the tree: one pass over the keys for each
+        field to count its choices, and one to partition them.
+
+        :param items: list of (key, value), with the original keys
+        :param fields: the fields not used yet, sorted
+        :param removed: the fields already used by the parent divisions
+    """
+    if len(items) == 1:
+        key, value = items[0]
+        key = frozendict2([(k, v) for k, v in key.items() if not k in removed])
+        return dict(type='sample', common=common, key=key, value=value)
+
+    fields_size = []
+    for field in fields:
+        values = set([key.get(field, _missing) for key, _ in items])
+        # only consider the fields present in all keys
+        if not _missing in values:
+            fields_size.append((field, len(values)))
 
     if not fields_size:
         # [frozendict({'i': 1, 'n': 3}), frozendict({'i': 2, 'n': 3}), frozendict({}), frozendict({'i': 0, 'n': 3})]
         msg = 'Not all records of the same type have the same fields'
-        msg += pformat(list(allruns.keys()))
+        msg += pformat([frozendict2([(k, v) for k, v in key.items() if not k in removed])
+                        for key, _ in items])
         raise ValueError(msg)
 
-    field = fields_size[0][0]
+    # Now choose the one with the least choices
+    field = min(fields_size, key=lambda x: x[1])[0]
+
+    groups = {}
+    for key, value in items:
+        groups.setdefault(key[field], []).append((key, value))
+
+    fields = [f for f in fields if f != field]
+    removed = removed + (field,)
     division = {}
-    for value, samples in allruns.groups_by_field_value(field):
-        samples = samples.remove_field(field)
+    for value in natsorted(groups):
+        samples = groups[value]
         c = dict(common)
         c[field] = value
         try:
-            division[value] = make_sections(samples, common=c)
+            division[value] = _make_sections(samples, fields=fields,
+                                             removed=removed, common=c)
         except Exception:
             msg = 'Error occurred inside grouping by field %r = %r' % (field, value)
             msg += '\nCommon: %r' % common
-            msg += '\nSamples: %s' % list(samples.keys())
+            msg += '\nSamples: %s' % [key for key, _ in samples]
             logger.error(msg)
             raise
 
@@ -693,3 +1286,9 @@ def basename_from_key(key: dict) -> str:
     basename = "-".join(values)
     basename = basename.replace('/', '_')  # XXX
     return basename
+
+
+def hashed_subdirs(basename: str, levels: int = 2) -> List[str]:
+    """ Returns the subdirectories for the given basename in the 'hashed' layout. """
+    h = hashlib.sha1(basename.encode('utf-8')).hexdigest()
+    return [h[2 * i:2 * i + 2] for i in range(levels)]
@@ -1,3 +1,18 @@
 from .generated_report import *
 from .create_index_dynamic import *
 from .configuration import *
+from .index_options import *
+from .manifest import *
+from .index_journal import *
+from .index_records import *
+from .similarity import *
+from .variations import *
+from .shared_reports import *
+from .index_sharded import *
+from .index_client import *
+from .report_hash import *
+from .report_delta import *
+from .report_registry import *
+from .html_writer import *
+from .blob_store import *
+from .report_storage import *
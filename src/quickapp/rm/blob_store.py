@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+__all__ = [
+    'BlobStore',
+    'release_linked_files',
+]
+
+
+class BlobStore:
+    """
+        Content-addressed store for the resources of the reports (figures,
+        etc.), in ``<dirname>/<xx>/<sha1><ext>``.
+
+        The files in the resources directory of a report are replaced by
+        hard links to the blobs, so identical files are stored once and
+        the pages do not change. If hard links are not possible (e.g. the
+        store is on another filesystem) the files are left alone.
+
+        Because a blob can be linked from many reports, the shared files
+        must be removed with release_tree() before a report is written
+        again in the same place; otherwise writing one report would
+        change the others.
+    """
+
+    def __init__(self, dirname: str):
+        self.dirname = dirname
+
+    def blob_filename(self, sha1: str, ext: str) -> str:
+        return os.path.join(self.dirname, sha1[:2], sha1 + ext)
+
+    def add_tree(self, dirname: str) -> int:
+        """
+            Moves the files under ``dirname`` in the store, leaving hard
+            links in their place. Returns the number of files linked.
+        """
+        n = 0
+        for root, _, files in os.walk(dirname):
+            for f in files:
+                if self.add_file(os.path.join(root, f)):
+                    n += 1
+        return n
+
+    def add_file(self, filename: str) -> bool:
+        st = os.stat(filename)
+        blob = self.blob_filename(_sha1_file(filename), os.path.splitext(filename)[1])
+        try:
+            blob_st = os.stat(blob)
+        except OSError:
+            blob_st = None
+
+        if blob_st is not None and blob_st.st_ino == st.st_ino and blob_st.st_dev == st.st_dev:
+            return True
+
+        try:
+            if blob_st is None:
+                dirname = os.path.dirname(blob)
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname, exist_ok=True)
+                try:
+                    os.link(filename, blob)
+                    return True
+                except FileExistsError:
+                    # another job added it in the meantime
+                    pass
+            tmp = '%s.tmp%s' % (filename, os.getpid())
+            os.link(blob, tmp)
+            os.replace(tmp, filename)
+            return True
+        except OSError:
+            # no hard links here
+            return False
+
+    def release_tree(self, dirname: str) -> None:
+        """ Removes the files under ``dirname`` that are linked from elsewhere. """
+        release_linked_files(dirname)
+
+
+def release_linked_files(dirname: str) -> None:
+    """
+        Removes the files under ``dirname`` that are linked from elsewhere
+        (st_nlink > 1), so that writing them again does not change the
+        other links. This must be done also when the BlobStore is not
+        used anymore, as the files could have been linked by a previous run.
+    """
+    if not os.path.exists(dirname):
+        return
+    for root, _, files in os.walk(dirname):
+        for f in files:
+            filename = os.path.join(root, f)
+            if os.lstat(filename).st_nlink > 1:
+                os.unlink(filename)
+
+
+def _sha1_file(filename: str) -> str:
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
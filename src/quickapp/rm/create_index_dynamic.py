@@ -5,6 +5,7 @@ __all__ = [
 ]
 
 from zuper_commons.types import check_isinstance
+from .report_storage import load_report
 
 
 def write_report_single(report: Report,
@@ -13,6 +14,7 @@ def write_report_single(report: Report,
                         write_pickle=False):
     from quickapp.report_manager import write_report
 
+    report = load_report(report)
     check_isinstance(report, Report)
     report.nid = report_nid
     write_report(report, report_html, static_dir=static_dir, write_pickle=write_pickle)
@@ -0,0 +1,59 @@
+import gzip
+import os
+import socket
+
+__all__ = [
+    'HTMLWriter',
+    'write_gzip_sibling',
+]
+
+
+class HTMLWriter:
+    """
+        Accumulates the pieces of a page, which are joined only once,
+        when the page is saved (or getvalue() is called).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.write = self._chunks.append
+
+    def getvalue(self) -> str:
+        return ''.join(self._chunks)
+
+    def save(self, filename: str, gzip_sibling: bool = False) -> None:
+        """
+            Writes the page in ``filename``, replacing it atomically, and
+            optionally also its compressed version ``filename.gz``.
+        """
+        data = self.getvalue().encode('utf-8')
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        _write_atomic(filename, data)
+        if gzip_sibling:
+            _write_atomic(filename + '.gz', gzip.compress(data, compresslevel=6))
+
+
+def write_gzip_sibling(filename: str) -> None:
+    """
+        Writes ``filename.gz`` (for static servers that send the
+        precompressed files), unless it is already up to date.
+    """
+    gz = filename + '.gz'
+    try:
+        if os.path.getmtime(gz) >= os.path.getmtime(filename):
+            return
+    except OSError:
+        pass
+    with open(filename, 'rb') as f:
+        data = f.read()
+    _write_atomic(gz, gzip.compress(data, compresslevel=6))
+
+
+def _write_atomic(filename: str, data: bytes) -> None:
+    # unique also among hosts sharing the directory
+    tmp = '%s.tmp-%s-%s' % (filename, socket.gethostname(), os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, filename)
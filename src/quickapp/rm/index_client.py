@@ -0,0 +1,195 @@
+import json
+import os
+
+from zuper_commons.text import natsorted
+
+from .html_writer import HTMLWriter
+from .manifest import RealpathCache
+
+__all__ = [
+    'index_manifest_filename',
+    'index_manifest_records',
+    'write_index_manifest',
+    'write_index_viewer',
+]
+
+
+def index_manifest_filename(index: str, manifest_format: str) -> str:
+    """ Returns the filename of the manifest for the given index. """
+    return os.path.splitext(index)[0] + '-manifest.' + manifest_format
+
+
+def index_manifest_records(reports, index, manifest):
+    """
+        Returns the list of records for the reports (StoreResults:
+        key -> filename) that exist, sorted by filename.
+
+        Each record is a dict with the fields ``key`` (including the
+        report type), ``filename`` (relative to the index),
+        ``mtime``, ``size`` and ``job_id`` (None if not known).
+    """
+    index_dir = os.path.dirname(os.path.realpath(index))
+    realpaths = RealpathCache()
+    records = {}
+    for key, filename in reports.items():
+        entry = manifest.stat(filename)
+        if entry is None:
+            continue
+        relname = os.path.relpath(realpaths.realpath(filename), index_dir)
+        records[relname] = dict(key=dict(key),
+                                filename=relname,
+                                mtime=entry['mtime'],
+                                size=entry['size'],
+                                job_id=entry.get('job_id', None))
+    return [records[x] for x in natsorted(records)]
+
+
+def write_index_manifest(reports, index, manifest, manifest_format, gzip=False) -> str:
+    """
+        Writes the manifest of the reports next to the index, either as
+        one JSON document ('json') or as one record per line ('ndjson').
+        Returns its filename.
+    """
+    records = index_manifest_records(reports, index, manifest)
+    filename = index_manifest_filename(index, manifest_format)
+
+    out = HTMLWriter()
+    if manifest_format == 'ndjson':
+        for r in records:
+            out.write(json.dumps(r, sort_keys=True, default=str))
+            out.write('\n')
+    else:
+        doc = dict(version=1, index=os.path.basename(index), reports=records)
+        out.write(json.dumps(doc, sort_keys=True, default=str))
+    out.save(filename, gzip_sibling=gzip)
+    return filename
+
+
+def write_index_viewer(index: str, manifest_filename: str, gzip=False) -> None:
+    """
+        Writes in ``index`` a static page that loads the manifest and
+        renders the list of reports in the browser.
+
+        The page does not depend on the reports, so it is rewritten
+        only if its contents would change. Note that browsers usually do not
+        allow loading the manifest from file:// URLs; the directory
+        needs to be served over HTTP.
+    """
+    url = os.path.relpath(os.path.realpath(manifest_filename),
+                          os.path.dirname(os.path.realpath(index)))
+    html = INDEX_VIEWER_HTML.replace('@MANIFEST_URL@', json.dumps(url))
+    if os.path.exists(index) and (not gzip or os.path.exists(index + '.gz')):
+        with open(index) as f:
+            if f.read() == html:
+                return
+    out = HTMLWriter()
+    out.write(html)
+    out.save(index, gzip_sibling=gzip)
+
+
+INDEX_VIEWER_HTML = """<html>
+<head>
+<meta charset="utf-8"/>
+<style type="text/css">
+    #status { color: gray; }
+    #viewport { height: 85vh; overflow-y: auto; position: relative; border-top: 1px solid #ccc; }
+    #viewport div.row { position: absolute; left: 0; right: 0; height: 22px;
+                        line-height: 22px; white-space: nowrap; overflow: hidden; }
+    span.when { float: right; margin-right: 1em; }
+</style>
+</head>
+<body>
+<p>
+    <input id="filter" type="text" size="50" placeholder="filter (e.g. report = foo)"/>
+    <select id="order">
+        <option value="name">by name</option>
+        <option value="newest">newest first</option>
+    </select>
+    <span id="status">Loading...</span>
+</p>
+<div id="viewport"><div id="spacer"></div></div>
+<script type="text/javascript">
+(function () {
+    var MANIFEST_URL = @MANIFEST_URL@;
+    var ROW_HEIGHT = 22;
+    var all = [];
+    var shown = [];
+    var viewport = document.getElementById('viewport');
+    var spacer = document.getElementById('spacer');
+    var status = document.getElementById('status');
+
+    function parse(text) {
+        if (/\\.ndjson$/.test(MANIFEST_URL)) {
+            return text.split('\\n').filter(function (l) { return l.length; })
+                       .map(function (l) { return JSON.parse(l); });
+        }
+        return JSON.parse(text).reports;
+    }
+
+    function describe(key) {
+        return Object.keys(key).sort().map(function (k) {
+            return k + ' = ' + key[k];
+        }).join(',  ');
+    }
+
+    function ago(mtime) {
+        var s = Date.now() / 1000 - mtime;
+        var units = [[86400, 'd'], [3600, 'h'], [60, 'm']];
+        for (var i = 0; i < units.length; i++) {
+            if (s >= units[i][0]) return Math.floor(s / units[i][0]) + units[i][1];
+        }
+        return Math.max(0, Math.floor(s)) + 's';
+    }
+
+    function escape(s) {
+        return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/"/g, '&quot;');
+    }
+
+    function update() {
+        var terms = document.getElementById('filter').value.toLowerCase().split(/\\s+/);
+        shown = all.filter(function (r) {
+            return terms.every(function (t) { return r.desc.toLowerCase().indexOf(t) >= 0; });
+        });
+        if (document.getElementById('order').value === 'newest') {
+            shown.sort(function (a, b) { return b.mtime - a.mtime; });
+        }
+        status.textContent = shown.length + ' of ' + all.length + ' reports';
+        spacer.style.height = (shown.length * ROW_HEIGHT) + 'px';
+        render();
+    }
+
+    // Only the rows that are visible are in the DOM.
+    function render() {
+        var first = Math.floor(viewport.scrollTop / ROW_HEIGHT);
+        var n = Math.ceil(viewport.clientHeight / ROW_HEIGHT) + 1;
+        var html = '';
+        for (var i = first; i < Math.min(shown.length, first + n); i++) {
+            var r = shown[i];
+            html += '<div class="row" style="top: ' + (i * ROW_HEIGHT) + 'px">' +
+                    '<a href="' + escape(r.filename) + '">' + escape(r.desc) + '</a>' +
+                    '<span class="when">' + ago(r.mtime) + ' ago</span></div>';
+        }
+        spacer.innerHTML = html;
+    }
+
+    viewport.addEventListener('scroll', render);
+    window.addEventListener('resize', render);
+    document.getElementById('filter').addEventListener('input', update);
+    document.getElementById('order').addEventListener('change', update);
+
+    fetch(MANIFEST_URL).then(function (response) {
+        if (!response.ok) throw new Error(response.statusText);
+        return response.text();
+    }).then(function (text) {
+        all = parse(text);
+        all.forEach(function (r) { r.desc = describe(r.key); });
+        update();
+    }).catch(function (e) {
+        status.innerHTML = 'Could not load <a href="' + escape(MANIFEST_URL) + '">' +
+                           escape(MANIFEST_URL) + '</a>: ' + escape(e.message);
+    });
+})();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from typing import List
+
+from .manifest import report_file_entry
+
+__all__ = [
+    'IndexJournal',
+]
+
+
+class IndexJournal:
+    """
+        Append-only journal of the reports written for one index.
+
+        Every write job appends one line (a JSON object) describing the
+        report it just wrote (see :py:func:`report_file_entry`); replaying
+        the journal gives the :py:class:`ReportManifest`.
+
+        The index itself is regenerated by the write jobs at most once
+        every ``debounce`` seconds, and once more, unconditionally, by
+        the final index job.
+
+        The journal lives next to the index, in ``<index>.journal``.
+    """
+
+    def __init__(self, index_filename: str):
+        self.index_filename = index_filename
+        self.filename = index_filename + '.journal'
+
+    def record(self, report_html: str, job_id: str = None, **extra) -> dict:
+        """
+            Appends the entry for the given (just written) report,
+            optionally with the id of the job that created it and
+            other (JSON-serializable) fields.
+        """
+        entry = report_file_entry(report_html)
+        entry['time'] = time.time()
+        if job_id is not None:
+            entry['job_id'] = job_id
+        entry.update(extra)
+        line = json.dumps(entry, sort_keys=True) + '\n'
+
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+
+        # A single write() with O_APPEND: concurrent writers do not
+        # interleave their lines.
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+        return entry
+
+    def read(self) -> List[dict]:
+        """ Returns all the entries, oldest first. Torn lines are ignored. """
+        if not os.path.exists(self.filename):
+            return []
+        entries = []
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass
+        return entries
+
+    def index_is_due(self, debounce: float) -> bool:
+        """
+            Returns True if the index was not regenerated in the
+            last ``debounce`` seconds (or does not exist yet).
+        """
+        if debounce <= 0:
+            return True
+        try:
+            last = os.path.getmtime(self.index_filename)
+        except OSError:
+            return True
+        return time.time() - last >= debounce
+
+    def compact(self) -> None:
+        """ Rewrites the journal keeping only the last entry for each report. """
+        last = {}
+        for entry in self.read():
+            last.pop(entry['filename'], None)
+            last[entry['filename']] = entry
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            for entry in last.values():
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+        os.replace(tmp, self.filename)
@@ -0,0 +1,71 @@
+__all__ = [
+    'IndexOptions',
+]
+
+
+class IndexOptions:
+    """
+        How the index of a ReportManager is written.
+
+        :param debounce: the write jobs regenerate the index at most once
+            every this many seconds (a final job always writes it once more).
+        :param mode: 'single' writes one page with all reports; 'sharded'
+            writes a small root page, plus paginated pages for each shard
+            (report type and value of its top-level field).
+        :param page_size: number of reports per page in 'sharded' mode.
+        :param manifest_format: if not None ('json' or 'ndjson'), a
+            machine-readable manifest of the reports is written next to
+            the index. In 'client' mode the index is a static page that
+            loads this manifest and renders it in the browser ('ndjson'
+            is used if no format was given).
+        :param gzip: also write a compressed ``.gz`` copy next to every
+            page (reports and index), for static servers.
+        :param aggregate: the write jobs leave one completion record per
+            report (see :py:class:`IndexRecords`) instead of appending to
+            the journal, and the index is written by one job at a time,
+            holding the :py:class:`IndexLock`; a job that finds the index
+            locked leaves it to the others. Use this with many parallel
+            jobs, or when the output directory is on NFS.
+    """
+
+    MODES = ('single', 'sharded', 'client')
+    MANIFEST_FORMATS = ('json', 'ndjson')
+
+    def __init__(self, debounce: float = 10.0, mode: str = 'single',
+                 page_size: int = 1000, manifest_format: str = None,
+                 gzip: bool = False, aggregate: bool = False):
+        self.debounce = debounce
+        self.gzip = gzip
+        self.aggregate = aggregate
+        self.set_mode(mode, page_size)
+        self.set_manifest_format(manifest_format)
+
+    def set_mode(self, mode: str, page_size: int = None):
+        if not mode in IndexOptions.MODES:
+            msg = 'Invalid index mode %r; expected one of %s.' % (mode, IndexOptions.MODES)
+            raise ValueError(msg)
+        self.mode = mode
+        if page_size is not None:
+            if page_size < 1:
+                msg = 'Invalid page size %r.' % page_size
+                raise ValueError(msg)
+            self.page_size = page_size
+
+    def set_manifest_format(self, manifest_format: str = None):
+        if manifest_format is not None and not manifest_format in IndexOptions.MANIFEST_FORMATS:
+            msg = ('Invalid manifest format %r; expected one of %s.'
+                   % (manifest_format, IndexOptions.MANIFEST_FORMATS))
+            raise ValueError(msg)
+        self.manifest_format = manifest_format
+
+    def get_manifest_format(self):
+        """ Returns the format of the manifest to write, or None. """
+        if self.manifest_format is None and self.mode == 'client':
+            return 'ndjson'
+        return self.manifest_format
+
+    def __eq__(self, other):
+        return isinstance(other, IndexOptions) and self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'IndexOptions(%s)' % ', '.join('%s=%r' % x for x in sorted(self.__dict__.items()))
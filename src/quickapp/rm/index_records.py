@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import socket
+import time
+from typing import List
+
+from .html_writer import _write_atomic
+from .index_journal import IndexJournal
+from .manifest import report_file_entry
+
+__all__ = [
+    'IndexRecords',
+    'IndexLock',
+]
+
+
+class IndexRecords(IndexJournal):
+    """
+        Alternative to the :py:class:`IndexJournal` for many concurrent
+        writers, possibly on different hosts sharing the output
+        directory over NFS, where appending to one file is not safe.
+
+        Every report has its own small completion record, in
+        ``<index>.records/<xx>/<sha1 of the filename>.json``, which is
+        written to a temporary file and renamed in place; a reader sees
+        either the old record or the new one.
+    """
+
+    def __init__(self, index_filename: str):
+        IndexJournal.__init__(self, index_filename)
+        self.dirname = index_filename + '.records'
+
+    def record_filename(self, report_html: str) -> str:
+        sha1 = hashlib.sha1(report_html.encode('utf-8')).hexdigest()
+        return os.path.join(self.dirname, sha1[:2], sha1 + '.json')
+
+    def record(self, report_html: str, job_id: str = None, **extra) -> dict:
+        entry = report_file_entry(report_html)
+        entry['time'] = time.time()
+        if job_id is not None:
+            entry['job_id'] = job_id
+        entry.update(extra)
+
+        filename = self.record_filename(report_html)
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        _write_atomic(filename, json.dumps(entry, sort_keys=True).encode('utf-8'))
+        return entry
+
+    def read(self) -> List[dict]:
+        """ Returns all the entries, oldest first. """
+        entries = []
+        for root, _, files in os.walk(self.dirname):
+            for f in files:
+                if not f.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(root, f)) as fd:
+                        entries.append(json.load(fd))
+                except (OSError, ValueError):
+                    # removed in the meantime
+                    pass
+        entries.sort(key=lambda e: e['time'])
+        return entries
+
+    def compact(self) -> None:
+        """ There is already one record per report; removes the leftover temporary files. """
+        for root, _, files in os.walk(self.dirname):
+            for f in files:
+                if not f.endswith('.json'):
+                    try:
+                        os.unlink(os.path.join(root, f))
+                    except OSError:
+                        pass
+
+
+# seconds after which the lock used for breaking an IndexLock is stale
+BREAK_STALE_AFTER = 10.0
+
+
+class IndexLock:
+    """
+        Lock on the index, so that only one job at a time writes it.
+
+        The lock is the file ``<index>.lock``, created with
+        ``O_CREAT | O_EXCL`` (atomic also on NFS v3 and later), which
+        contains the host and pid of the owner. A lock is assumed to
+        belong to a job that died, and is broken, if it is older than
+        ``stale_after`` seconds, or at once if its owner was a process
+        on this host that does not exist anymore.
+    """
+
+    def __init__(self, index_filename: str, stale_after: float = 600.0):
+        self.filename = index_filename + '.lock'
+        self.stale_after = stale_after
+        self.locked = False
+
+    def acquire(self, blocking: bool = True, poll: float = 0.2) -> bool:
+        """ Returns True if the lock was acquired (always, if blocking). """
+        while True:
+            try:
+                fd = os.open(self.filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                if self._break_if_stale():
+                    continue
+                if not blocking:
+                    return False
+                time.sleep(poll)
+                continue
+            try:
+                owner = '%s %s %s\n' % (socket.gethostname(), os.getpid(), time.time())
+                os.write(fd, owner.encode('utf-8'))
+            finally:
+                os.close(fd)
+            self.locked = True
+            return True
+
+    def release(self) -> None:
+        if self.locked:
+            self.locked = False
+            try:
+                os.unlink(self.filename)
+            except OSError:
+                pass
+
+    def _break_if_stale(self) -> bool:
+        """ Returns True if the lock is not there anymore, or was broken. """
+        try:
+            with open(self.filename) as f:
+                owner = f.read()
+            mtime = os.path.getmtime(self.filename)
+        except OSError:
+            # released in the meantime
+            return True
+        if not self._is_stale(owner, mtime):
+            return False
+        return self._break(owner)
+
+    def _is_stale(self, owner: str, mtime: float) -> bool:
+        if time.time() - mtime >= self.stale_after:
+            return True
+        try:
+            host, pid, _ = owner.split()
+            pid = int(pid)
+        except ValueError:
+            # (still being written)
+            return False
+        if host != socket.gethostname():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            # exists, but belongs to somebody else
+            pass
+        return False
+
+    def _break(self, owner: str) -> bool:
+        """
+            Breaks the lock, which contained ``owner`` when it was found
+            stale; returns False if somebody else is breaking it.
+
+            The jobs breaking the lock take turns, using ``<lock>.break``
+            (held for a very short time; broken after ``BREAK_STALE_AFTER``
+            seconds), and check that the lock still contains ``owner``:
+            another job could have broken it and acquired it in the meantime.
+            The lock is then renamed to a unique name, and removed only if
+            the renamed file is still the stale one; otherwise it is put back,
+            unless another lock was created in the meantime.
+
+            ``<lock>.break`` contains a token, so that a breaker that took
+            longer than BREAK_STALE_AFTER does not remove the one of another
+            job.
+        """
+        break_lock = self.filename + '.break'
+        token = '%s %s %s\n' % (socket.gethostname(), os.getpid(), time.time())
+        try:
+            fd = os.open(break_lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(break_lock) >= BREAK_STALE_AFTER:
+                    os.unlink(break_lock)
+            except OSError:
+                pass
+            return False
+        try:
+            os.write(fd, token.encode('utf-8'))
+        finally:
+            os.close(fd)
+        try:
+            # another job could have broken it (and acquired it) before we got here
+            try:
+                with open(self.filename) as f:
+                    if f.read() != owner:
+                        return True
+            except OSError:
+                return True
+            broken = '%s.broken-%s-%s-%s' % (self.filename, socket.gethostname(),
+                                             os.getpid(), time.time())
+            try:
+                os.rename(self.filename, broken)
+            except OSError:
+                # released in the meantime
+                return True
+            try:
+                with open(broken) as f:
+                    still_stale = f.read() == owner
+            except OSError:
+                still_stale = False
+            if not still_stale:
+                try:
+                    # (fails if another job acquired the lock meanwhile)
+                    os.link(broken, self.filename)
+                except OSError:
+                    pass
+            os.unlink(broken)
+            return True
+        finally:
+            _unlink_if_contains(break_lock, token)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def _unlink_if_contains(filename: str, contents: str) -> None:
+    try:
+        with open(filename) as f:
+            if f.read() != contents:
+                return
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
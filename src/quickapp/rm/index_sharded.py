@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+
+from zuper_commons.text import natsorted
+
+from .html_writer import HTMLWriter, _write_atomic
+
+__all__ = [
+    'index_reports_sharded',
+]
+
+
+def index_reports_sharded(reports, index, manifest=None, page_size=1000, gzip=False):
+    """
+        Writes a sharded index: a small root page in ``index``, plus
+        paginated pages for each shard in ``<index>-shards/``.
+
+        A shard contains the reports of one type with the same value of
+        the top-level division field chosen by make_sections(). Only the
+        shards where some report changed (or was added) are written again;
+        their signatures are kept in ``<index>-shards/shards.json``.
+        The pages of the shards that do not exist anymore are removed.
+        With ``gzip``, a ``.gz`` copy of each page is written as well.
+    """
+    from quickapp.report_manager import (IndexEntries, INDEX_HTML_FOOTER,
+                                         INDEX_HTML_HEADER, last_reports_html)
+    from .manifest import ReportManifest
+
+    if manifest is None:
+        manifest = ReportManifest()
+    mtimes = manifest.mtimes(reports.values())
+
+    shards_dir = os.path.splitext(index)[0] + '-shards'
+    if not os.path.exists(shards_dir):
+        os.makedirs(shards_dir)
+
+    state_filename = os.path.join(shards_dir, 'shards.json')
+    if os.path.exists(state_filename):
+        with open(state_filename) as f:
+            old_state = json.load(f)
+    else:
+        old_state = {}
+
+    entries = IndexEntries(index, mtimes)
+    state = {}
+    root_links = []
+    all_pages = []
+    for report_type, title, shard_id, items in get_shards(reports):
+        npages = max(1, (len(items) + page_size - 1) // page_size)
+        pages = [os.path.join(shards_dir, shard_page_basename(shard_id, i))
+                 for i in range(npages)]
+        all_pages.extend(pages)
+        signature = shard_signature(items, mtimes, npages)
+        state[shard_id] = signature
+        root_links.append((report_type, title, pages[0], len(items), npages))
+
+        written = os.path.exists(pages[0]) and (not gzip or os.path.exists(pages[0] + '.gz'))
+        if old_state.get(shard_id, None) == signature and written:
+            continue
+
+        shard_entries = IndexEntries(pages[0], mtimes, now=entries.now)
+        for i, page in enumerate(pages):
+            page_items = items[i * page_size:(i + 1) * page_size]
+            out = HTMLWriter()
+            out.write(INDEX_HTML_HEADER)
+            out.write('<p><a href="%s">All report</a></p>\n'
+                      % shard_entries.href(index))
+            out.write('<h2>%s: %s</h2>\n' % (report_type, title))
+            out.write(pagination_html(pages, i))
+            out.write('<ul>')
+            for k, filename in page_items:
+                out.write(shard_entries.li(k, filename))
+            out.write('</ul>')
+            out.write(INDEX_HTML_FOOTER)
+            out.save(page, gzip_sibling=gzip)
+
+    _write_atomic(state_filename, json.dumps(state, sort_keys=True).encode('utf-8'))
+    remove_stale_pages(shards_dir, all_pages)
+
+    existing = [x for x in reports.items() if x[1] in mtimes]
+    out = HTMLWriter()
+    out.write(INDEX_HTML_HEADER)
+    out.write(last_reports_html(existing, entries, nlast=10))
+    out.write('<h2>All report</h2>\n')
+    current = None
+    for report_type, title, page, n, npages in root_links:
+        if report_type != current:
+            if current is not None:
+                out.write('</ul>')
+            out.write('<h3>%s</h3>\n<ul>' % report_type)
+            current = report_type
+        out.write('<li><a href="%s">%s</a> (%d reports, %d pages)</li>'
+                  % (entries.href(page), title, n, npages))
+    if current is not None:
+        out.write('</ul>')
+    out.write(INDEX_HTML_FOOTER)
+    out.save(index, gzip_sibling=gzip)
+
+
+def remove_stale_pages(shards_dir: str, pages) -> None:
+    """
+        Removes the pages in ``shards_dir`` (and their .gz copies) which
+        are not in ``pages``: those of the shards that disappeared, and
+        those beyond the current number of pages of a shard.
+    """
+    keep = set(os.path.basename(page) for page in pages)
+    for x in os.listdir(shards_dir):
+        basename = x[:-len('.gz')] if x.endswith('.gz') else x
+        if basename.endswith('.html') and basename not in keep:
+            try:
+                os.unlink(os.path.join(shards_dir, x))
+            except FileNotFoundError:
+                # removed by another writer
+                pass
+
+
+def get_shards(reports):
+    """
+        Yields (report_type, title, shard_id, items) for each shard,
+        where items is the list of (key, filename) in index order.
+    """
+    from quickapp.report_manager import make_sections, sort_by_type
+
+    used = set()
+
+    def unique(shard_id):
+        res = shard_id
+        i = 1
+        while res in used:
+            res = '%s-%d' % (shard_id, i)
+            i += 1
+        used.add(res)
+        return res
+
+    type2reports = sort_by_type(reports)
+    for report_type in natsorted(type2reports):
+        type_reports = type2reports[report_type]
+        type_sane = report_type.replace('_', '')
+        sections = make_sections(type_reports)
+        if sections['type'] == 'sample':
+            items = list(_leaves(sections))
+            yield report_type, 'all', unique(type_sane), items
+            continue
+
+        field = sections['field']
+        division = sections['division']
+        for value in natsorted(division):
+            title = '%s = %s' % (field, value)
+            shard_id = unique('%s-%s-%s' % (type_sane, _sane(field), _sane(value)))
+            items = list(_leaves(division[value]))
+            yield report_type, title, shard_id, items
+
+
+def _leaves(sections):
+    """ Yields (key, filename) for all the samples, in index order. """
+    if sections['type'] == 'sample':
+        key = dict(sections['common'])
+        key.update(sections['key'])
+        yield key, sections['value']
+    else:
+        division = sections['division']
+        for value in natsorted(division):
+            for x in _leaves(division[value]):
+                yield x
+
+
+def _sane(value) -> str:
+    s = str(value)
+    for c in ['_', '-', '.', ' ']:
+        s = s.replace(c, '')
+    return s.replace('/', '_')
+
+
+def shard_page_basename(shard_id: str, page: int) -> str:
+    if page == 0:
+        return shard_id + '.html'
+    return '%s-p%d.html' % (shard_id, page + 1)
+
+
+def shard_signature(items, mtimes, npages) -> str:
+    """ Changes if any report of the shard is added, removed or rewritten. """
+    data = [npages] + [[sorted(k.items()), filename, mtimes.get(filename, None)]
+                       for k, filename in items]
+    return hashlib.sha1(json.dumps(data, default=str).encode('utf-8')).hexdigest()
+
+
+def pagination_html(pages, current: int) -> str:
+    if len(pages) == 1:
+        return ''
+    s = '<p>Page: '
+    for i, page in enumerate(pages):
+        if i == current:
+            s += '<b>%d</b> ' % (i + 1)
+        else:
+            s += '<a href="%s">%d</a> ' % (os.path.basename(page), i + 1)
+    s += '</p>\n'
+    return s
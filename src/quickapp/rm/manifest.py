@@ -0,0 +1,102 @@
+import hashlib
+import os
+from typing import Dict, Iterable, List, Optional
+
+__all__ = [
+    'RealpathCache',
+    'ReportManifest',
+    'report_file_entry',
+]
+
+
+def report_file_entry(filename: str) -> dict:
+    """ Returns the metadata (size, mtime, content hash) of a report file. """
+    st = os.stat(filename)
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return dict(filename=filename,
+                size=st.st_size,
+                mtime=st.st_mtime,
+                sha1=h.hexdigest())
+
+
+class ReportManifest:
+    """
+        Metadata of the report files written so far: filename -> entry
+        (see :py:func:`report_file_entry`).
+
+        It is maintained by the write jobs through the
+        :py:class:`IndexJournal`, so that writing the index does not need
+        to stat every report file.
+    """
+
+    def __init__(self, entries: Iterable[dict] = ()):
+        self._entries = {}
+        for entry in entries:
+            self._entries[entry['filename']] = entry
+
+    @staticmethod
+    def from_journal(journal) -> "ReportManifest":
+        return ReportManifest(journal.read())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._entries
+
+    def entries(self) -> List[dict]:
+        return list(self._entries.values())
+
+    def get(self, filename: str) -> Optional[dict]:
+        return self._entries.get(filename, None)
+
+    def stat(self, filename: str) -> Optional[dict]:
+        """
+            Returns the entry for the file, or dict(size, mtime) from the
+            filesystem if it is not in the manifest; None if it does not exist.
+        """
+        entry = self._entries.get(filename, None)
+        if entry is not None:
+            return entry
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return dict(filename=filename, size=st.st_size, mtime=st.st_mtime)
+
+    def mtimes(self, filenames: Iterable[str]) -> Dict[str, float]:
+        """
+            Returns filename -> mtime for the files that exist.
+            Only the files not in the manifest are looked up on disk.
+        """
+        res = {}
+        for filename in filenames:
+            entry = self._entries.get(filename, None)
+            if entry is not None:
+                res[filename] = entry['mtime']
+                continue
+            try:
+                res[filename] = os.stat(filename).st_mtime
+            except OSError:
+                pass
+        return res
+
+
+class RealpathCache:
+    """
+        os.path.realpath() for many files in few directories: the
+        directories are resolved once (realpath() costs one lstat per
+        path component); the file names are assumed not to be links.
+    """
+
+    def __init__(self):
+        self._realdirs = {}
+
+    def realpath(self, filename: str) -> str:
+        d, b = os.path.split(filename)
+        if not d in self._realdirs:
+            self._realdirs[d] = os.path.realpath(d)
+        return os.path.join(self._realdirs[d], b)
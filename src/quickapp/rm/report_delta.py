@@ -0,0 +1,50 @@
+__all__ = [
+    'ReportsDelta',
+]
+
+
+class ReportsDelta:
+    """
+        The reports added by a (dynamically branched) context, in the
+        compact form that is sent back to the root to build the index:
+        key -> (job_id, filename), with the key as a sorted tuple of items.
+    """
+    __slots__ = ('entries',)
+
+    def __init__(self, entries=None):
+        if entries is None:
+            entries = {}
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        return dict(entries=self.entries)
+
+    def __setstate__(self, state):
+        self.entries = state['entries']
+
+    def add(self, key: dict, job_id: str, filename: str) -> None:
+        self._put(tuple(sorted(key.items())), job_id, filename)
+
+    def update(self, other: "ReportsDelta") -> None:
+        """ Adds the entries of the other delta, checking for duplicates. """
+        if not self.entries:
+            self.entries = dict(other.entries)
+            return
+        for k, (job_id, filename) in other.entries.items():
+            self._put(k, job_id, filename)
+
+    def _put(self, k, job_id, filename):
+        previous = self.entries.get(k, None)
+        if previous is not None and previous[0] != job_id:
+            msg = 'Found duplicate report %r' % dict(k)
+            msg += ' jobs %s and %s' % (job_id, previous[0])
+            raise ValueError(msg)
+        self.entries[k] = (job_id, filename)
+
+    def items(self):
+        """ Yields (key, job_id, filename), with key a dict. """
+        for k, (job_id, filename) in self.entries.items():
+            yield dict(k), job_id, filename
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import pickle
+
+__all__ = [
+    'report_content_hash',
+    'ReportHashSidecar',
+]
+
+
+def report_content_hash(report, **kwargs) -> str:
+    """
+        Returns a hash of everything that determines the HTML written
+        for the report: the report tree, the extra arguments given to
+        to_html() and the version of reprep.
+
+        The hash is stable for the same Report object (e.g., loaded again
+        from the compmake DB); a report computed again usually changes
+        (figures embed their creation date).
+    """
+    import reprep
+    h = hashlib.sha1()
+    h.update(reprep.__version__.encode('utf-8'))
+    h.update(pickle.dumps(report, protocol=2))
+    for k in sorted(kwargs):
+        h.update(('\n%s=%r' % (k, kwargs[k])).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ReportHashSidecar:
+    """
+        The content hash of a written report, kept in ``<report_html>.sha1``.
+
+        The sidecar is removed before the report is written again, so it
+        is only there if the last write completed.
+    """
+
+    def __init__(self, report_html: str):
+        self.report_html = report_html
+        self.filename = report_html + '.sha1'
+
+    def matches(self, sha1: str) -> bool:
+        """ Returns True if the report was written with this content hash. """
+        if not os.path.exists(self.report_html):
+            return False
+        try:
+            with open(self.filename) as f:
+                return f.read().strip() == sha1
+        except OSError:
+            return False
+
+    def invalidate(self) -> None:
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+    def save(self, sha1: str) -> None:
+        tmp = '%s.tmp%s' % (self.filename, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(sha1 + '\n')
+        os.replace(tmp, self.filename)
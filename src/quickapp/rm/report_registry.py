@@ -0,0 +1,90 @@
+import pickle
+import zlib
+
+from reprep.utils import frozendict2
+
+__all__ = [
+    'ReportRegistry',
+]
+
+
+class ReportRegistry:
+    """
+        The reports known to a ReportManager: for each key, the id of the
+        job computing the report and the filename where it is written,
+        plus the fields used by each report type.
+
+        The keys are kept as sorted tuples of items and the jobs as plain
+        ids. When pickled, the columns are compressed together: the
+        filenames, job ids and fields are very repetitive.
+    """
+    __slots__ = ('_keys', '_job_ids', '_filenames', '_formats', '_index')
+
+    def __init__(self):
+        self._keys = []
+        self._job_ids = []
+        self._filenames = []
+        # report_type -> sorted list of fields
+        self._formats = {}
+        # key tuple -> position
+        self._index = {}
+
+    def __getstate__(self):
+        columns = (self._keys, self._job_ids, self._filenames, self._formats)
+        data = pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL)
+        return dict(columns=zlib.compress(data, 1))
+
+    def __setstate__(self, state):
+        columns = pickle.loads(zlib.decompress(state['columns']))
+        self._keys, self._job_ids, self._filenames, self._formats = columns
+        self._index = dict((k, i) for i, k in enumerate(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key: dict) -> bool:
+        return _as_tuple(key) in self._index
+
+    def check_format(self, report_type: str, fields) -> None:
+        """ Checks that all reports of the same type have the same fields. """
+        fields = sorted(fields)
+        if not report_type in self._formats:
+            self._formats[report_type] = fields
+        else:
+            fields0 = self._formats[report_type]
+            if not fields == fields0:
+                msg = 'Report %r %r' % (report_type, fields)
+                msg += '\ndoes not match previous format %r' % fields0
+                raise ValueError(msg)
+
+    def add(self, key: dict, job_id: str, filename: str) -> None:
+        """ Adds the report, or replaces the one with the same key. """
+        k = _as_tuple(key)
+        i = self._index.get(k, None)
+        if i is None:
+            self._index[k] = len(self._keys)
+            self._keys.append(k)
+            self._job_ids.append(job_id)
+            self._filenames.append(filename)
+        else:
+            self._job_ids[i] = job_id
+            self._filenames[i] = filename
+
+    def get_job_id(self, key: dict) -> str:
+        return self._job_ids[self._index[_as_tuple(key)]]
+
+    def get_filename(self, key: dict) -> str:
+        return self._filenames[self._index[_as_tuple(key)]]
+
+    def items(self, since: int = 0):
+        """
+            Yields (key, job_id, filename) for the reports, in the order
+            they were added, skipping the first ``since``;
+            key is a frozendict2.
+        """
+        for i in range(since, len(self._keys)):
+            yield frozendict2(self._keys[i]), self._job_ids[i], self._filenames[i]
+
+
+def _as_tuple(key: dict) -> tuple:
+    return tuple(sorted(key.items()))
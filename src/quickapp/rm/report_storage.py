@@ -0,0 +1,181 @@
+import io
+import os
+import pickle
+import socket
+import struct
+
+from reprep import Report
+from reprep.node import Node
+from zuper_commons.types import check_isinstance
+
+__all__ = [
+    'IndexedReport',
+    'save_report_indexed',
+    'load_report',
+]
+
+MAGIC = b'QAREPORT1\n'
+TRAILER = struct.Struct('<Q')
+
+
+class IndexedReport:
+    """
+        Handle to a Report saved by save_report_indexed(), which can load
+        either the whole report or only the subtree at a given url.
+
+        The file contains one pickle per node, in depth-first order, so
+        that every subtree is one contiguous range of bytes, followed by
+        the index of the nodes (class, nid, parent, offset, length, end
+        of the subtree).
+
+        The handle itself is small: it is what the compmake job returns,
+        instead of the Report.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._index = None
+        self._skeleton = None
+
+    def __getstate__(self):
+        return dict(filename=self.filename)
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'])
+
+    def __eq__(self, other):
+        return isinstance(other, IndexedReport) and self.filename == other.filename
+
+    def __repr__(self):
+        return 'IndexedReport(%r)' % self.filename
+
+    def __len__(self):
+        """ Returns the number of nodes. """
+        return len(self._get_index())
+
+    def load(self, url: str = None) -> Node:
+        """
+            Loads the whole report, or the node at ``url`` (resolved as
+            Report.resolve_url() would do) with its subtree, detached
+            from its parent. Raises NotExistent if there is no such node.
+        """
+        if url is None:
+            i = 0
+        else:
+            i = self._get_skeleton().resolve_url(url).qa_index
+        return self._load_subtree(i)
+
+    def _get_index(self):
+        if self._index is None:
+            with open(self.filename, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    msg = 'Not an indexed report: %s' % self.filename
+                    raise ValueError(msg)
+                f.seek(-TRAILER.size, os.SEEK_END)
+                index_offset, = TRAILER.unpack(f.read(TRAILER.size))
+                f.seek(index_offset)
+                self._index = pickle.load(f)
+        return self._index
+
+    def _get_skeleton(self):
+        """ An empty Node for each node, for resolving the urls. """
+        if self._skeleton is None:
+            skeleton = []
+            for i, (_, nid, parent, _, _, _) in enumerate(self._get_index()):
+                node = Node(nid)
+                node.qa_index = i
+                if parent is not None:
+                    skeleton[parent].add_child(node)
+                skeleton.append(node)
+            self._skeleton = skeleton[0]
+        return self._skeleton
+
+    def _load_subtree(self, i: int) -> Node:
+        index = self._get_index()
+        end = index[i][5]
+        start = index[i][3]
+        stop = index[end - 1][3] + index[end - 1][4]
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            data = f.read(stop - start)
+
+        # the nodes are created first, then their state is loaded:
+        # references to nodes outside of the subtree become None
+        nodes = dict((j, index[j][0].__new__(index[j][0])) for j in range(i, end))
+        for j in range(i, end):
+            offset = index[j][3] - start
+            unpickler = _NodeUnpickler(io.BytesIO(data[offset:offset + index[j][4]]), nodes)
+            nodes[j].__dict__.update(unpickler.load())
+        return nodes[i]
+
+
+# (no annotations: this is a job, compmake uses getargspec())
+def save_report_indexed(report, filename):
+    """ Saves the report in ``filename`` (see IndexedReport) and returns its handle. """
+    check_isinstance(report, Report)
+
+    nodes = []
+    parents = []
+    ends = []
+
+    def visit(node, parent):
+        i = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        ends.append(None)
+        for child in node.children:
+            visit(child, i)
+        ends[i] = len(nodes)
+
+    visit(report, None)
+    positions = dict((id(node), i) for i, node in enumerate(nodes))
+
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname, exist_ok=True)
+    tmp = '%s.tmp-%s-%s' % (filename, socket.gethostname(), os.getpid())
+    index = []
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        for i, node in enumerate(nodes):
+            buf = io.BytesIO()
+            _NodePickler(buf, positions).dump(node.__dict__)
+            data = buf.getvalue()
+            index.append((type(node), node.nid, parents[i], f.tell(), len(data), ends[i]))
+            f.write(data)
+        index_offset = f.tell()
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(TRAILER.pack(index_offset))
+    os.replace(tmp, filename)
+    return IndexedReport(filename)
+
+
+def load_report(report) -> Report:
+    """ Returns the Report, loading it if it is an IndexedReport. """
+    if isinstance(report, IndexedReport):
+        return report.load()
+    return report
+
+
+class _NodePickler(pickle.Pickler):
+    """ Pickles the references to the nodes as their position. """
+
+    def __init__(self, f, positions):
+        pickle.Pickler.__init__(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.positions = positions
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Node):
+            # -1: a node that is not part of the report
+            return self.positions.get(id(obj), -1)
+        return None
+
+
+class _NodeUnpickler(pickle.Unpickler):
+
+    def __init__(self, f, nodes):
+        pickle.Unpickler.__init__(self, f)
+        self.nodes = nodes
+
+    def persistent_load(self, pid):
+        return self.nodes.get(pid, None)
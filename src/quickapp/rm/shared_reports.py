@@ -0,0 +1,228 @@
+import hashlib
+import os
+import pickle
+
+from .similarity import SimilarityIndex
+from .variations import VariationTable
+
+__all__ = [
+    'LatestSharedReportsRef',
+    'SharedReports',
+    'SharedReportsRef',
+    'SharedVariationsRef',
+    'resolve_shared',
+    'save_latest_shared_reports',
+    'save_shared_reports',
+]
+
+
+class SharedReportsRef:
+    """
+        Reference to a report -> filename mapping saved once on disk.
+
+        The mapping is content-addressed: its filename is the hash of its
+        contents, so the jobs that receive this (small) reference as
+        an argument (the final index) are invalidated exactly when a
+        report is added or removed. It is loaded at most once per process.
+    """
+    __slots__ = ('filename', 'sha1')
+
+    def __init__(self, filename: str, sha1: str):
+        self.filename = filename
+        self.sha1 = sha1
+
+    def __eq__(self, other):
+        return isinstance(other, SharedReportsRef) and self.sha1 == other.sha1
+
+    def __hash__(self):
+        return hash(self.sha1)
+
+    def __repr__(self):
+        return 'SharedReportsRef(%s)' % self.sha1[:8]
+
+    def __getstate__(self):
+        return dict(filename=self.filename, sha1=self.sha1)
+
+    def __setstate__(self, state):
+        self.filename = state['filename']
+        self.sha1 = state['sha1']
+
+    def load(self) -> "SharedReports":
+        if not self.sha1 in _loaded:
+            if len(_loaded) >= 4:
+                _loaded.clear()
+            _loaded[self.sha1] = _load_shared_reports(self)
+        return _loaded[self.sha1]
+
+    def for_type(self, report_type: str) -> "SharedVariationsRef":
+        return SharedVariationsRef(self, report_type)
+
+
+class SharedVariationsRef:
+    """ Reference to the VariationTable of one report type. """
+    __slots__ = ('shared', 'report_type')
+
+    def __init__(self, shared: SharedReportsRef, report_type: str):
+        self.shared = shared
+        self.report_type = report_type
+
+    def __eq__(self, other):
+        return (isinstance(other, SharedVariationsRef) and
+                self.shared == other.shared and
+                self.report_type == other.report_type)
+
+    def __hash__(self):
+        return hash((self.shared, self.report_type))
+
+    def __repr__(self):
+        return 'SharedVariationsRef(%r, %r)' % (self.shared, self.report_type)
+
+    def __getstate__(self):
+        return dict(shared=self.shared, report_type=self.report_type)
+
+    def __setstate__(self, state):
+        self.shared = state['shared']
+        self.report_type = state['report_type']
+
+    def load(self) -> VariationTable:
+        return self.shared.load().variations(self.report_type)
+
+
+class LatestSharedReportsRef:
+    """
+        Reference to the last mapping saved in a directory with
+        save_latest_shared_reports(), resolved when it is loaded.
+
+        It does not change when reports are added, so the write jobs,
+        which need the mapping only for the intermediate versions of
+        the index, are not invalidated by the other reports.
+    """
+    __slots__ = ('dirname',)
+
+    def __init__(self, dirname: str):
+        self.dirname = dirname
+
+    def __eq__(self, other):
+        return isinstance(other, LatestSharedReportsRef) and self.dirname == other.dirname
+
+    def __hash__(self):
+        return hash(self.dirname)
+
+    def __repr__(self):
+        return 'LatestSharedReportsRef(%r)' % self.dirname
+
+    def __getstate__(self):
+        return dict(dirname=self.dirname)
+
+    def __setstate__(self, state):
+        self.dirname = state['dirname']
+
+    def load(self) -> "SharedReports":
+        with open(os.path.join(self.dirname, LATEST)) as f:
+            sha1 = f.read().strip()
+        filename = os.path.join(self.dirname, 'reports-%s.pickle' % sha1)
+        return SharedReportsRef(filename, sha1).load()
+
+
+class SharedReports:
+    """
+        The report -> filename mapping, together with the structures
+        derived from it, which are built lazily and only once per process.
+    """
+
+    def __init__(self, reports):
+        self.reports = reports
+        self._type2reports = None
+        self._similarity = None
+        self._variations = {}
+
+    def type2reports(self):
+        if self._type2reports is None:
+            from quickapp.report_manager import sort_by_type
+            self._type2reports = sort_by_type(self.reports)
+        return self._type2reports
+
+    def similarity(self) -> SimilarityIndex:
+        if self._similarity is None:
+            self._similarity = SimilarityIndex(self.type2reports())
+        return self._similarity
+
+    def variations(self, report_type: str) -> VariationTable:
+        if not report_type in self._variations:
+            reports = self.type2reports()[report_type]
+            self._variations[report_type] = VariationTable(reports)
+        return self._variations[report_type]
+
+
+# sha1 -> SharedReports, for this process
+_loaded = {}
+
+
+def save_shared_reports(dirname: str, reports) -> SharedReportsRef:
+    """
+        Saves the mapping (StoreResults: key -> filename) in ``dirname``,
+        unless it is already there, and returns a reference to it.
+    """
+    # Canonical form, independent of the hash seed of this process
+    # (frozendict2 pickles its cached hash).
+    items = [(tuple(sorted(key.items())), filename)
+             for key, filename in reports.items()]
+    data = pickle.dumps(items, protocol=2)
+    sha1 = hashlib.sha1(data).hexdigest()
+    filename = os.path.join(dirname, 'reports-%s.pickle' % sha1)
+
+    if not os.path.exists(filename):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        tmp = '%s.tmp%s' % (filename, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, filename)
+
+    return SharedReportsRef(filename, sha1)
+
+
+# file with the sha1 of the last mapping; see LatestSharedReportsRef
+LATEST = 'reports-latest'
+
+
+def save_latest_shared_reports(ref: SharedReportsRef) -> LatestSharedReportsRef:
+    """ Makes ``ref`` the last mapping saved in its directory. """
+    dirname = os.path.dirname(ref.filename)
+    filename = os.path.join(dirname, LATEST)
+    if os.path.exists(filename):
+        with open(filename) as f:
+            if f.read().strip() == ref.sha1:
+                return LatestSharedReportsRef(dirname)
+    tmp = '%s.tmp%s' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(ref.sha1 + '\n')
+    os.replace(tmp, filename)
+    return LatestSharedReportsRef(dirname)
+
+
+def _load_shared_reports(ref: SharedReportsRef) -> SharedReports:
+    from reprep.report_utils import StoreResults
+    if not os.path.exists(ref.filename):
+        msg = ('The shared report mapping %s does not exist; '
+               'the jobs need to be defined again.' % ref.filename)
+        raise ValueError(msg)
+    with open(ref.filename, 'rb') as f:
+        items = pickle.load(f)
+    reports = StoreResults()
+    for key, filename in items:
+        reports[dict(key)] = filename
+    return SharedReports(reports)
+
+
+def resolve_shared(x):
+    """
+        Loads x if it is a reference to shared data: returns the
+        StoreResults for a SharedReportsRef or a LatestSharedReportsRef,
+        and the VariationTable for a SharedVariationsRef.
+    """
+    if isinstance(x, (SharedReportsRef, LatestSharedReportsRef)):
+        return x.load().reports
+    if isinstance(x, SharedVariationsRef):
+        return x.load()
+    return x
@@ -0,0 +1,58 @@
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from reprep.report_utils import StoreResults
+
+__all__ = [
+    'SimilarityIndex',
+]
+
+
+class SimilarityIndex:
+    """
+        Inverted index used to find, for a report, the most similar
+        report of every other type.
+
+        The similarity of two keys is the number of values they have in
+        common (see :py:func:`quickapp.report_manager.get_most_similar`);
+        for each report type we keep value -> keys having that value,
+        so that a lookup only visits the keys sharing at least one value.
+    """
+
+    def __init__(self, type2reports: Dict[str, "StoreResults"]):
+        # report_type -> list of keys
+        self.keys = {}
+        # report_type -> value -> list of keys
+        self.postings = {}
+        for report_type, reports in type2reports.items():
+            keys = list(reports.keys())
+            postings = {}
+            for key in keys:
+                for value in set(key.values()):
+                    postings.setdefault(value, []).append(key)
+            self.keys[report_type] = keys
+            self.postings[report_type] = postings
+
+    def most_similar(self, report_type: str, key: dict) -> Optional[dict]:
+        """
+            Returns the key of the given type most similar to ``key``,
+            or None if there is a tie.
+        """
+        keys = self.keys[report_type]
+        postings = self.postings[report_type]
+        scores = {}
+        for value in set(key.values()):
+            for k in postings.get(value, ()):
+                scores[k] = scores.get(k, 0) + 1
+
+        if not scores:
+            # every key has score 0
+            if len(keys) == 1:
+                return keys[0]
+            return None
+
+        best = max(scores.values())
+        winners = [k for k, score in scores.items() if score == best]
+        if len(winners) > 1:
+            return None
+        return winners[0]
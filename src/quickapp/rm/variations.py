@@ -0,0 +1,84 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from reprep.report_utils import StoreResults
+
+__all__ = [
+    'VariationTable',
+]
+
+
+class VariationTable:
+    """
+        Navigation structure for the reports of one type: for each
+        (key, field), the reports that differ from key only in the
+        value of that field.
+
+        It is built once from the StoreResults (key -> filename) of the
+        type, so that the links of every report can be rendered with
+        dictionary lookups only.
+    """
+
+    def __init__(self, reports: "StoreResults"):
+        # (sorted: the order is part of the pages, and of their hash)
+        self.fields = sorted(reports.field_names())
+        # a type without fields has only one report
+        self.single = None
+        if not self.fields:
+            for _, filename in reports.items():
+                self.single = filename
+        # field -> sorted list of values
+        self.values = {}
+        # field -> (key without field) -> value -> filename
+        self.siblings = {}
+        for field in self.fields:
+            self.values[field] = sorted(set(reports.field_values(field)))
+            groups = {}
+            for key, filename in reports.items():
+                groups.setdefault(_without(key, field), {})[key[field]] = filename
+            self.siblings[field] = groups
+
+    def __eq__(self, other):
+        return (isinstance(other, VariationTable) and
+                self.fields == other.fields and self.single == other.single and
+                self.values == other.values and self.siblings == other.siblings)
+
+    def restrict(self, key: dict) -> "VariationTable":
+        """
+            Returns the part of the table needed for the links of the
+            report ``key``: it changes only if those links change, so it
+            can be given to the job writing that report.
+        """
+        table = VariationTable.__new__(VariationTable)
+        table.fields = self.fields
+        table.single = self.single
+        table.values = self.values
+        table.siblings = {}
+        for field in self.fields:
+            without = _without(key, field)
+            table.siblings[field] = {without: self.siblings[field].get(without, {})}
+        return table
+
+    def filename(self, key: dict) -> str:
+        """ Returns the filename of the report with the given key. """
+        if not self.fields:
+            return self.single
+        field = self.fields[0]
+        try:
+            return self.siblings[field][_without(key, field)][key[field]]
+        except KeyError:
+            msg = 'No report with key %s' % key
+            raise KeyError(msg)
+
+    def variations(self, key: dict, field: str) -> List[Tuple[object, Optional[str]]]:
+        """
+            Returns the list of (value, filename) for all the values of
+            ``field``, where filename is None if there is no report
+            obtained by changing only that field of ``key``.
+        """
+        siblings = self.siblings[field].get(_without(key, field), {})
+        return [(value, siblings.get(value, None)) for value in self.values[field]]
+
+
+def _without(key, field):
+    return frozenset((k, v) for k, v in key.items() if k != field)
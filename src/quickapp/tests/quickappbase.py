@@ -1,3 +1,8 @@
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+
 from compmake.jobs.storage import all_jobs
 from compmake.unittests.compmake_test import CompmakeTest
 from quickapp import quickapp_main
@@ -13,3 +18,30 @@ class QuickappTest(CompmakeTest):
         # tell the context that it's all good
         jobs = all_jobs(self.db)
         self.cc.reset_jobs_defined_in_this_session(jobs)
+
+
+class ReportFilesTest(unittest.TestCase):
+    """ Utilities for testing the files written for the reports and the index """
+
+    def setUp(self):
+        self.root = mkdtemp()
+        # where QuickApp writes the index
+        self.index = os.path.join(self.root, 'report.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_file(self, filename: str, data) -> str:
+        """ Writes ``data`` (str or bytes) to ``filename``, relative to the
+            temporary directory; returns the full path. """
+        filename = os.path.join(self.root, filename)
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(filename, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        return filename
+
+    def write_page(self, name: str) -> str:
+        """ Writes a placeholder for the page of a report (its content is its name). """
+        return self.write_file(name, name)
@@ -0,0 +1,132 @@
+import os
+
+from nose.tools import istest
+
+from quickapp import QuickApp
+from quickapp.report_manager import write_report_with_links
+from quickapp.rm import BlobStore
+from reprep import Report
+from reprep.report_utils import StoreResults
+
+from .quickappbase import QuickappTest, ReportFilesTest
+
+
+def read_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def make_report(values):
+    r = Report()
+    f = r.figure('fig')
+    with f.plot('p') as pylab:
+        pylab.plot(values)
+    return r
+
+
+@istest
+class BlobStoreTest(ReportFilesTest):
+
+    def setUp(self):
+        ReportFilesTest.setUp(self)
+        self.blobs = BlobStore(os.path.join(self.root, 'blobs'))
+
+    def duplicates_are_linked_test(self):
+        a = os.path.join(self.root, 'r1', 'fig.png')
+        b = os.path.join(self.root, 'r2', 'sub', 'fig.png')
+        c = os.path.join(self.root, 'r2', 'other.png')
+        self.write_file(a, b'same')
+        self.write_file(b, b'same')
+        self.write_file(c, b'different')
+
+        self.assertEqual(self.blobs.add_tree(os.path.join(self.root, 'r1')), 1)
+        self.assertEqual(self.blobs.add_tree(os.path.join(self.root, 'r2')), 2)
+        # adding again does not change anything
+        self.assertEqual(self.blobs.add_tree(os.path.join(self.root, 'r1')), 1)
+
+        self.assertEqual(os.stat(a).st_ino, os.stat(b).st_ino)
+        self.assertNotEqual(os.stat(a).st_ino, os.stat(c).st_ino)
+        self.assertEqual(read_file(b), b'same')
+        self.assertEqual(read_file(c), b'different')
+        # one blob per content
+        nblobs = sum(len(files) for _, _, files in os.walk(self.blobs.dirname))
+        self.assertEqual(nblobs, 2)
+
+    def release_before_rewrite_test(self):
+        a = os.path.join(self.root, 'r1', 'fig.png')
+        b = os.path.join(self.root, 'r2', 'fig.png')
+        self.write_file(a, b'same')
+        self.write_file(b, b'same')
+        self.blobs.add_tree(os.path.join(self.root, 'r1'))
+        self.blobs.add_tree(os.path.join(self.root, 'r2'))
+
+        self.blobs.release_tree(os.path.join(self.root, 'r1'))
+        self.assertFalse(os.path.exists(a))
+        self.write_file(a, b'changed')
+        self.assertEqual(read_file(b), b'same')
+
+    def write_report(self, name, report, blobs_dir):
+        report_html = os.path.join(self.root, 'r', name + '.html')
+        others = StoreResults()
+        others[dict(name=name)] = report_html
+        write_report_with_links(report=report, report_nid=name, report_html=report_html,
+                                index_filename=os.path.join(self.root, 'index.html'),
+                                this_report=dict(name=name),
+                                other_reports_same_type=others,
+                                most_similar_other_type=[],
+                                static_dir=os.path.join(self.root, 'static'),
+                                blobs_dir=blobs_dir)
+        resources = os.path.join(self.root, 'r', name)
+        return [os.path.join(root, f) for root, _, files in os.walk(resources)
+                for f in files if f.endswith('.png')]
+
+    def rewrite_without_store_test(self):
+        # written with the store, then rewritten without it
+        a1, = self.write_report('a', make_report([1, 2]), self.blobs.dirname)
+        b1, = self.write_report('b', make_report([1, 2]), self.blobs.dirname)
+        self.assertEqual(os.stat(a1).st_ino, os.stat(b1).st_ino)
+        before = read_file(b1)
+
+        a2, = self.write_report('a', make_report([2, 1]), None)
+        self.assertNotEqual(read_file(a2), before)
+        self.assertEqual(read_file(b1), before)
+
+
+class QuickAppBlobsChild(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        for i in range(2):
+            context.add_report(context.comp(make_report, [1, 2]), 'fig', i=i)
+        context.get_report_manager().create_index_job(context)
+
+
+class QuickAppBlobs(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        context.get_report_manager().set_blob_store()
+        context.add_report(context.comp(make_report, [3, 4]), 'fig', i=0)
+        self.call_recursive(context, 'sub', QuickAppBlobsChild, [],
+                            separate_report_manager=True)
+
+
+@istest
+class BlobStoreAppTest(QuickappTest):
+
+    def separate_report_manager_test(self):
+        self.run_quickapp(QuickAppBlobs, cmd='make recurse=1')
+        blobs_dir = os.path.join(self.root0, 'report', 'reprep-blobs')
+        blobs = set(os.stat(os.path.join(root, f)).st_ino
+                    for root, _, files in os.walk(blobs_dir) for f in files)
+        # the figures of the child are linked into the store of the parent
+        figures = [os.path.join(root, f)
+                   for root, _, files in os.walk(os.path.join(self.root0, 'sub'))
+                   for f in files if f.endswith('.png')]
+        self.assertEqual(len(figures), 2)
+        for filename in figures:
+            self.assertIn(os.stat(filename).st_ino, blobs)
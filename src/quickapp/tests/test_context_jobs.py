@@ -0,0 +1,106 @@
+from compmake.jobs.storage import get_job, get_job_userobject
+from nose.tools import istest
+
+from quickapp import QuickApp, QuickAppContext
+from quickapp.compmake_context import COMP_MAP_INLINE_MAX
+
+from .quickappbase import QuickappTest
+
+
+def f(x):
+    return x
+
+
+@istest
+class ContextJobsTest(QuickappTest):
+
+    def mySetUp(self):
+        self.context = QuickAppContext(cc=self.cc, qapp=None, parent=None, job_prefix=None,
+                                       output_dir=self.root0)
+
+    def counters_test(self):
+        c1 = self.context.child('a')
+        c2 = c1.child('b')
+        self.context.comp(f, 0)
+        for i in range(3):
+            c1.comp(f, i)
+        c2.comp(f, 0, extra_dep=[self.context.comp(f, 1)])
+        self.assertEqual(self.context.n_comp_invocations, 6)
+        self.assertEqual(c1.n_comp_invocations, 4)
+        self.assertEqual(c2.n_comp_invocations, 1)
+
+    def jobs_of_test(self):
+        c1 = self.context.child('a')
+        c2 = c1.child('b')
+        p1 = c1.comp(f, 1)
+        self.context.add_jobs_of(c1)
+        c1.add_jobs_of(c2)
+        # also the jobs defined afterwards
+        p2 = c2.comp(f, 2)
+        self.assertEqual(sorted(self.context.all_jobs_dict()), sorted([p1.job_id, p2.job_id]))
+        self.assertEqual(list(c2.all_jobs_dict()), [p2.job_id])
+
+    def barrier_test(self):
+        c1 = self.context.child('a')
+        self.context.add_jobs_of(c1)
+        p1 = self.context.comp(f, 1)
+        p2 = c1.comp(f, 2)
+        b1 = self.context.barrier('b1')
+        p3 = self.context.comp(f, 3)
+        p4 = c1.comp(f, 4)
+        b2 = self.context.checkpoint('b2')
+        p5 = self.context.comp(f, 5)
+
+        def children(promise):
+            return get_job(promise.job_id, self.db).children
+
+        self.assertEqual(children(b1), {p1.job_id, p2.job_id})
+        self.assertEqual(children(p3), {b1.job_id})
+        # the child context sees the barrier, even if created before
+        self.assertEqual(children(p4), {b1.job_id})
+        self.assertEqual(children(b2), {b1.job_id, p3.job_id, p4.job_id})
+        self.assertEqual(children(p5), {b2.job_id})
+
+    def comp_map_test(self):
+        promises = self.context.comp_map(f, range(3))
+        self.assertEqual(promises.job_ids(), ['f', 'f-2', 'f-3'])
+        c1 = self.context.child('a')
+        promises = c1.comp_map(g, range(4), job_id_fn=lambda x: 'g%d' % x, b=10)
+        self.assertEqual(promises.job_ids(), ['a-g0', 'a-g1', 'a-g2', 'a-g3'])
+        self.assertEqual(c1.n_comp_invocations, 4)
+        c2 = self.context.child('b')
+        c2.comp_map(g, range(4), b=list(range(COMP_MAP_INLINE_MAX)))
+        # plus the job storing the common arguments
+        self.assertEqual(c2.n_comp_invocations, 5)
+        self.assertEqual(len(c2.all_jobs_dict()), 5)
+
+
+def g(x, b):
+    if isinstance(b, list):
+        b = len(b)
+    return x + b
+
+
+def total(values):
+    return sum(values)
+
+
+class QuickAppCompMap(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        values = context.comp_map(g, range(10), b=1)
+        context.comp(total, values, job_id='total')
+        values = context.comp_map(g, range(10), b=[0] * COMP_MAP_INLINE_MAX)
+        context.comp(total, values, job_id='total-shared')
+
+
+@istest
+class CompMapTest(QuickappTest):
+
+    def comp_map_app_test(self):
+        self.run_quickapp(QuickAppCompMap, cmd='make')
+        self.assertEqual(get_job_userobject('total', self.db), 55)
+        self.assertEqual(get_job_userobject('total-shared', self.db), 45 + 10 * COMP_MAP_INLINE_MAX)
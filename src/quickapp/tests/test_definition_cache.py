@@ -0,0 +1,123 @@
+import os
+import shutil
+import sys
+from tempfile import mkdtemp
+
+from compmake.jobs.storage import get_job_userobject
+from nose.tools import istest
+
+from quickapp import QuickApp, quickapp_main
+from reprep import Report
+
+from .quickappbase import QuickappTest
+
+
+def f(x):
+    return x
+
+
+def make_report(x):
+    r = Report('r')
+    r.text('x', str(x))
+    return r
+
+
+class QuickAppCachedChild(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        context.comp(f, 'child', job_id='child')
+
+
+class QuickAppCached(QuickApp):
+
+    defined = 0
+
+    def define_options(self, params):
+        params.add_int('n', default=2)
+
+    def define_jobs_context(self, context):
+        QuickAppCached.defined += 1
+        n = self.get_options().n
+        for i in range(n):
+            context.add_report(context.comp(make_report, i), 'r', i=i)
+        self.call_recursive(context, 'c', QuickAppCachedChild, [])
+
+
+HELPER = """
+def value():
+    return %r
+"""
+
+APP = """
+from quickapp import QuickApp
+
+from .helper import value
+
+defined = [0]
+
+
+def f(x):
+    return x
+
+
+class QuickAppHelper(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        defined[0] += 1
+        context.comp(f, value())
+"""
+
+
+@istest
+class DefinitionCacheTest(QuickappTest):
+
+    def run_cached(self, *extra):
+        args = ['-o', self.root0, '-c', 'make recurse=1', '--compress',
+                '--definition_cache'] + list(extra)
+        self.assertEqual(0, quickapp_main(QuickAppCached, args, sys_exit=False))
+
+    def definition_cache_test(self):
+        QuickAppCached.defined = 0
+        self.run_cached()
+        self.assertEqual(QuickAppCached.defined, 1)
+        self.run_cached()
+        self.assertEqual(QuickAppCached.defined, 1)
+
+        # other options: defined again
+        self.run_cached('--n', '3')
+        self.assertEqual(QuickAppCached.defined, 2)
+        self.assertEqual(get_job_userobject('c-child', self.db), 'child')
+        self.assertEqual(get_job_userobject('make_report-3', self.db).nid, 'r')
+
+    def helper_module_test(self):
+        # a package whose app uses a function of another module
+        path = mkdtemp()
+        package = os.path.join(path, 'qa_cache_package')
+        os.makedirs(package)
+        for name, contents in [('__init__', ''), ('app', APP), ('helper', HELPER % 1)]:
+            with open(os.path.join(package, name + '.py'), 'w') as f:
+                f.write(contents)
+        sys.path.insert(0, path)
+        try:
+            from qa_cache_package import app
+            args = ['-o', self.root0, '-c', 'make', '--definition_cache']
+            for _ in range(2):
+                self.assertEqual(0, quickapp_main(app.QuickAppHelper, args, sys_exit=False))
+            self.assertEqual(app.defined[0], 1)
+
+            with open(os.path.join(package, 'helper.py'), 'w') as f:
+                f.write(HELPER % 2)
+            self.assertEqual(0, quickapp_main(app.QuickAppHelper, args, sys_exit=False))
+            self.assertEqual(app.defined[0], 2)
+        finally:
+            sys.path.remove(path)
+            for name in list(sys.modules):
+                if name.startswith('qa_cache_package'):
+                    del sys.modules[name]
+            shutil.rmtree(path)
@@ -0,0 +1,74 @@
+import json
+import os
+
+from nose.tools import istest
+
+from quickapp import QuickApp, quickapp_main
+from quickapp.definition_profile import DefinitionProfile, format_definition_profile
+
+from .quickappbase import QuickappTest
+
+
+def f(x):
+    return x
+
+
+class QuickAppProfiledChild(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        context.comp_map(f, range(3))
+
+
+class QuickAppProfiled(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        context.comp(f, 0)
+        c = context.child('c')
+        c.comp(f, [0] * 1000)
+        self.call_recursive(c, 'sub', QuickAppProfiledChild, [])
+
+
+@istest
+class DefinitionProfileTest(QuickappTest):
+
+    def format_test(self):
+        p = DefinitionProfile('root', 'app')
+        p.child('a').add_jobs(2, 1.0, 100)
+        p.child('b').add_jobs(1, 0.001, 10)
+        p.span = 2.0
+        s = format_definition_profile(p, min_fraction=0.01)
+        lines = s.splitlines()
+        # header, root, a (b takes less than 1%)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(' root (app)'))
+        self.assertTrue(lines[2].endswith('    a'))
+
+    def overhead_test(self):
+        # the time spent reading the sizes is not counted
+        p = DefinitionProfile('root', 'app')
+        p.child('a').add_jobs(1, 0.5, 100, overhead=1.0)
+        p.span = 2.0
+        self.assertEqual(p.children[0].total_time(), 0.5)
+        self.assertEqual(p.total_time(), 1.0)
+
+    def profile_definition_test(self):
+        args = ['-o', self.root0, '-c', 'make', '--profile_definition']
+        self.assertEqual(0, quickapp_main(QuickAppProfiled, args, sys_exit=False))
+        with open(os.path.join(self.root0, 'definition-profile.json')) as fi:
+            root = json.load(fi)
+        self.assertEqual(root['kind'], 'app')
+        self.assertEqual(root['n_comp'], 5)
+        self.assertEqual(root['own']['n_comp'], 1)
+        c, = root['children']
+        self.assertEqual(c['n_comp'], 4)
+        self.assertGreater(c['own']['nbytes'], 1000)
+        sub, = c['children']
+        self.assertEqual((sub['name'], sub['kind'], sub['n_comp']), ('sub', 'subtask', 3))
+        self.assertGreater(root['time'], sub['time'])
+        self.assertTrue(os.path.exists(os.path.join(self.root0, 'definition-profile.txt')))
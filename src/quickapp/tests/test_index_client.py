@@ -0,0 +1,60 @@
+import json
+import os
+from unittest import mock
+
+from nose.tools import istest
+
+from quickapp.report_manager import write_index
+from quickapp.rm import IndexJournal, IndexOptions, ReportManifest, index_manifest_records
+from reprep.report_utils import StoreResults
+
+from .quickappbase import ReportFilesTest
+
+
+@istest
+class IndexClientTest(ReportFilesTest):
+
+    def setUp(self):
+        ReportFilesTest.setUp(self)
+        self.reports = StoreResults()
+        journal = IndexJournal(self.index)
+        for a in range(3):
+            filename = os.path.join(self.root, 'report', 'r', 'r-%s.html' % a)
+            self.reports[dict(report='r', a=a)] = filename
+            if a == 2:
+                continue  # not written yet
+            self.write_file(filename, 'report %s' % a)
+            journal.record(filename, job_id='job%s' % a)
+        self.manifest = ReportManifest.from_journal(journal)
+
+    def ndjson_test(self):
+        options = IndexOptions(mode='client')
+        write_index(self.reports, self.index, self.manifest, options)
+        with open(os.path.join(self.root, 'report-manifest.ndjson')) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r['filename'] for r in records],
+                         ['report/r/r-0.html', 'report/r/r-1.html'])
+        self.assertEqual(records[1]['key'], dict(report='r', a=1))
+        self.assertEqual(records[1]['job_id'], 'job1')
+        self.assertEqual(records[1]['size'], len('report 1'))
+        with open(self.index) as f:
+            self.assertIn('"report-manifest.ndjson"', f.read())
+
+    def json_test(self):
+        options = IndexOptions(manifest_format='json')
+        write_index(self.reports, self.index, self.manifest, options)
+        with open(os.path.join(self.root, 'report-manifest.json')) as f:
+            doc = json.load(f)
+        self.assertEqual(len(doc['reports']), 2)
+        # the html index is still written in 'single' mode
+        with open(self.index) as f:
+            self.assertIn('All report', f.read())
+        self.assertRaises(ValueError, options.set_manifest_format, 'xml')
+
+    def realpath_per_directory_test(self):
+        realpath = os.path.realpath
+        with mock.patch('os.path.realpath', side_effect=realpath) as m:
+            records = index_manifest_records(self.reports, self.index, self.manifest)
+        self.assertEqual(len(records), 2)
+        # the index directory and the reports directory
+        self.assertEqual(m.call_count, 2)
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+from nose.tools import istest
+
+from quickapp.report_manager import report_order_statistics
+from quickapp.rm import IndexJournal, ReportManifest
+
+from .quickappbase import ReportFilesTest
+
+
+@istest
+class IndexJournalTest(ReportFilesTest):
+
+    def record_and_compact_test(self):
+        journal = IndexJournal(self.index)
+        a = self.write_page('a.html')
+        b = self.write_page('b.html')
+        journal.record(a)
+        journal.record(b)
+        journal.record(a)
+        self.assertEqual([e['filename'] for e in journal.read()], [a, b, a])
+
+        journal.compact()
+        self.assertEqual([e['filename'] for e in journal.read()], [b, a])
+
+    def debounce_test(self):
+        journal = IndexJournal(self.index)
+        # no index yet
+        self.assertTrue(journal.index_is_due(1000))
+        self.write_page('report.html')
+        self.assertFalse(journal.index_is_due(1000))
+        self.assertTrue(journal.index_is_due(0))
+
+    def manifest_test(self):
+        journal = IndexJournal(self.index)
+        a = self.write_page('a.html')
+        journal.record(a)
+        os.utime(a, (1000, 1000))
+        missing = os.path.join(self.root, 'missing.html')
+        c = self.write_page('c.html')
+
+        manifest = ReportManifest.from_journal(journal)
+        self.assertIn(a, manifest)
+        self.assertEqual(manifest.get(a)['size'], len('a.html'))
+        mtimes = manifest.mtimes([a, missing, c])
+        # the manifest is trusted: a is not looked up again
+        self.assertNotEqual(mtimes[a], 1000)
+        self.assertEqual(mtimes[c], os.path.getmtime(c))
+        self.assertNotIn(missing, mtimes)
+
+
+def test_report_order_statistics():
+    mtimes = dict(a=3.0, b=1.0, c=3.0, d=2.0, e=10.0)
+    orders = report_order_statistics(mtimes)
+    alltimes = np.array(list(mtimes.values()))
+    for filename, t in mtimes.items():
+        assert orders[filename] == np.mean((alltimes < t) * 1.0)
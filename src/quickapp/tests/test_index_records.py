@@ -0,0 +1,125 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from unittest import mock
+
+from nose.tools import istest
+
+from quickapp.report_manager import update_index_if_due, write_index_final
+from quickapp.rm import IndexLock, IndexOptions, IndexRecords
+from reprep.report_utils import StoreResults
+
+from .quickappbase import ReportFilesTest
+
+
+@istest
+class IndexRecordsTest(ReportFilesTest):
+
+    def one_record_per_report_test(self):
+        records = IndexRecords(self.index)
+        a = self.write_page('a.html')
+        b = self.write_page('b.html')
+        records.record(a, job_id='ja')
+        records.record(b)
+        records.record(a, job_id='ja2')
+        entries = records.read()
+        self.assertEqual([e['filename'] for e in entries], [b, a])
+        self.assertEqual(entries[1]['job_id'], 'ja2')
+        # no temporary files left
+        for _, _, files in os.walk(records.dirname):
+            for f in files:
+                self.assertTrue(f.endswith('.json'), f)
+
+    def lock_test(self):
+        lock1 = IndexLock(self.index)
+        lock2 = IndexLock(self.index)
+        self.assertTrue(lock1.acquire(blocking=False))
+        self.assertFalse(lock2.acquire(blocking=False))
+        lock1.release()
+        self.assertTrue(lock2.acquire(blocking=False))
+        lock2.release()
+        self.assertFalse(os.path.exists(lock2.filename))
+
+    def stale_lock_test(self):
+        lock1 = IndexLock(self.index)
+        lock1.acquire()
+        os.utime(lock1.filename, (1000, 1000))
+        # the owner died a long time ago
+        self.assertTrue(IndexLock(self.index).acquire(blocking=False))
+
+    def dead_local_owner_test(self):
+        p = subprocess.Popen([sys.executable, '-c', 'pass'])
+        p.wait()
+        with open(self.index + '.lock', 'w') as f:
+            f.write('%s %s %s\n' % (socket.gethostname(), p.pid, time.time()))
+        # broken at once, without waiting for stale_after
+        self.assertTrue(IndexLock(self.index).acquire(blocking=False))
+
+    def break_only_the_stale_lock_test(self):
+        # another job broke the stale lock and acquired it, after
+        # we read the stale one
+        lock1 = IndexLock(self.index)
+        lock1.acquire()
+        with open(lock1.filename) as f:
+            owner = f.read()
+        IndexLock(self.index)._break('otherhost 1 0\n')
+        with open(lock1.filename) as f:
+            self.assertEqual(f.read(), owner)
+        self.assertFalse(IndexLock(self.index).acquire(blocking=False))
+        self.assertEqual(os.listdir(os.path.dirname(lock1.filename)).count('report.html.lock'), 1)
+        self.assertFalse([x for x in os.listdir(os.path.dirname(lock1.filename))
+                          if '.broken-' in x])
+
+    def break_lock_of_another_job_test(self):
+        # this breaker stalled, its .break was broken and taken by another job
+        lock = IndexLock(self.index)
+        with open(lock.filename, 'w') as f:
+            f.write('otherhost 1 0\n')
+        os.utime(lock.filename, (1000, 1000))
+        break_lock = lock.filename + '.break'
+        real_rename = os.rename
+
+        def rename(src, dst):
+            real_rename(src, dst)
+            if os.path.exists(break_lock):
+                os.unlink(break_lock)
+            with open(break_lock, 'w') as f:
+                f.write('other job\n')
+            # and another job acquired the lock
+            with open(lock.filename, 'w') as f:
+                f.write('fresh\n')
+
+        with mock.patch('os.rename', side_effect=rename):
+            self.assertTrue(lock._break('otherhost 1 0\n'))
+        with open(break_lock) as f:
+            self.assertEqual(f.read(), 'other job\n')
+        with open(lock.filename) as f:
+            self.assertEqual(f.read(), 'fresh\n')
+
+    def single_writer_test(self):
+        options = IndexOptions(debounce=0, aggregate=True)
+        reports = StoreResults()
+        records = IndexRecords(self.index)
+        for i in range(3):
+            filename = self.write_page('r-%d.html' % i)
+            reports[dict(report='r', i=i)] = filename
+            records.record(filename)
+
+        lock = IndexLock(self.index)
+        lock.acquire()
+        # the write jobs leave the index to whoever holds the lock
+        update_index_if_due(records, reports, options)
+        self.assertFalse(os.path.exists(self.index))
+        lock.release()
+
+        update_index_if_due(records, reports, options)
+        self.assertTrue(os.path.exists(self.index))
+        write_index_final(reports, self.index, options)
+        with open(self.index) as f:
+            html = f.read()
+        for i in range(3):
+            self.assertIn('r-%d.html' % i, html)
+        self.assertFalse(os.path.exists(lock.filename))
+        self.assertFalse(os.path.exists(self.index + '.journal'))
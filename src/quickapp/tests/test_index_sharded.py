@@ -0,0 +1,69 @@
+import os
+
+from nose.tools import istest
+
+from quickapp.rm import IndexOptions, index_reports_sharded
+from reprep.report_utils import StoreResults
+
+from .quickappbase import ReportFilesTest
+
+
+@istest
+class IndexShardedTest(ReportFilesTest):
+
+    def sharded_test(self):
+        reports = StoreResults()
+        for a in range(5):
+            for b in ['x', 'y']:
+                filename = self.write_file('report/r/%s-%s.html' % (a, b), 'report')
+                reports[dict(report='r', a=a, b=b)] = filename
+                os.utime(filename, (1000 + a, 1000 + a))
+
+        index_reports_sharded(reports, self.index, page_size=2)
+        shards = os.path.join(self.root, 'report-shards')
+        # 'b' has fewer choices than 'a': one shard per value of b, 3 pages each
+        pages = sorted(x for x in os.listdir(shards) if x.endswith('.html'))
+        self.assertEqual(pages, ['r-b-x-p2.html', 'r-b-x-p3.html', 'r-b-x.html',
+                                 'r-b-y-p2.html', 'r-b-y-p3.html', 'r-b-y.html'])
+        with open(self.index) as f:
+            root = f.read()
+        self.assertIn('href="report-shards/r-b-x.html"', root)
+
+        def page_mtimes():
+            return dict((x, os.path.getmtime(os.path.join(shards, x))) for x in pages)
+
+        for x in pages:
+            os.utime(os.path.join(shards, x), (0, 0))
+        before = page_mtimes()
+        # rewrite one report of shard b=y
+        os.utime(reports[dict(report='r', a=1, b='y')], (2000, 2000))
+        index_reports_sharded(reports, self.index, page_size=2)
+        after = page_mtimes()
+        changed = sorted(x for x in pages if before[x] != after[x])
+        self.assertEqual(changed, ['r-b-y-p2.html', 'r-b-y-p3.html', 'r-b-y.html'])
+
+    def stale_pages_test(self):
+        reports = StoreResults()
+        for a in range(5):
+            for b in ['x', 'y']:
+                reports[dict(report='r', a=a, b=b)] = os.path.join(self.root, '%s-%s.html' % (a, b))
+        index_reports_sharded(reports, self.index, page_size=2, gzip=True)
+
+        # fewer pages for b=x, no more b=y
+        fewer = StoreResults()
+        for a in range(3):
+            fewer[dict(report='r', a=a, b='x')] = reports[dict(report='r', a=a, b='x')]
+        fewer[dict(report='r', a=0, b='z')] = os.path.join(self.root, '0-z.html')
+        index_reports_sharded(fewer, self.index, page_size=2, gzip=True)
+        shards = os.path.join(self.root, 'report-shards')
+        pages = sorted(x for x in os.listdir(shards) if '.html' in x)
+        self.assertEqual(pages, ['r-b-x-p2.html', 'r-b-x-p2.html.gz', 'r-b-x.html',
+                                 'r-b-x.html.gz', 'r-b-z.html', 'r-b-z.html.gz'])
+        self.assertFalse([x for x in os.listdir(shards) if '.tmp' in x])
+
+    def options_test(self):
+        options = IndexOptions()
+        self.assertEqual(options.mode, 'single')
+        options.set_mode('sharded', page_size=10)
+        self.assertEqual(options, IndexOptions(mode='sharded', page_size=10))
+        self.assertRaises(ValueError, options.set_mode, 'other')
@@ -0,0 +1,45 @@
+from quickapp.report_manager import make_sections
+from reprep.report_utils import StoreResults
+
+
+def test_make_sections():
+    reports = StoreResults()
+    for a in [1, 2, 3]:
+        for b in ['x', 'y']:
+            reports[dict(report='r', a=a, b=b)] = '%s-%s.html' % (a, b)
+
+    sections = make_sections(reports)
+    # 'report' has 1 choice, then 'b' has 2, then 'a'
+    assert sections['type'] == 'division'
+    assert sections['field'] == 'report'
+    level2 = sections['division']['r']
+    assert level2['field'] == 'b'
+    assert level2['common'] == dict(report='r')
+    level3 = level2['division']['y']
+    assert level3['field'] == 'a'
+    sample = level3['division'][2]
+    assert sample == dict(type='sample', common=dict(report='r', b='y', a=2),
+                          key={}, value='2-y.html')
+
+
+def test_make_sections_remaining_key():
+    reports = StoreResults()
+    reports[dict(report='r', a=1)] = 'r1.html'
+    reports[dict(report='s', a=1, b=2)] = 's.html'
+    sections = make_sections(reports)
+    # 'a' and 'report' have the same number of choices: ties are by name
+    assert sections['field'] == 'a'
+    sample = sections['division'][1]['division']['s']
+    assert sample['key'] == dict(b=2)
+
+
+def test_make_sections_inconsistent():
+    reports = StoreResults()
+    reports[dict(a=1)] = 'a.html'
+    reports[dict(b=1)] = 'b.html'
+    try:
+        make_sections(reports)
+    except ValueError:
+        pass
+    else:
+        raise Exception('expected ValueError')
@@ -0,0 +1,53 @@
+import os
+
+from nose.tools import istest
+
+from quickapp import QuickApp, iterate_context_names
+from quickapp.rm import ReportsDelta
+
+from .quickappbase import QuickappTest
+from .test_recursive_reports import report_example1
+
+
+def instance_report(context, param1):
+    r = context.comp(report_example1, param1=param1, param2=0)
+    context.add_report(r, 'report_example1', param1=param1)
+
+
+class QuickAppManyBranches(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        r = context.comp(report_example1, param1='root', param2=0)
+        context.add_report(r, 'report_example1', param1='root')
+        # more than MERGE_FAN_IN branches
+        for c, param1 in iterate_context_names(context, ['p%d' % i for i in range(12)]):
+            c.comp_dynamic(instance_report, param1)
+
+
+@istest
+class ReportDeltaTest(QuickappTest):
+
+    def report_delta_test(self):
+        a = ReportsDelta()
+        a.add(dict(report='r', x=1), 'job1', 'r-1.html')
+        b = ReportsDelta()
+        b.add(dict(x=2, report='r'), 'job2', 'r-2.html')
+        # the same report from two branches is fine
+        b.add(dict(report='r', x=1), 'job1', 'r-1.html')
+        a.update(b)
+        self.assertEqual(len(a), 2)
+        c = ReportsDelta()
+        c.add(dict(report='r', x=2), 'job3', 'r-2.html')
+        self.assertRaises(ValueError, a.update, c)
+
+    def report_delta_app_test(self):
+        self.run_quickapp(QuickAppManyBranches, cmd='make recurse=1')
+        self.assertTrue(len(self.get_jobs('_dynreports_merge*')) > 1)
+        with open(os.path.join(self.root0, 'report.html')) as f:
+            index = f.read()
+        for i in range(12):
+            self.assertIn('param1 = p%d' % i, index)
+        self.assertIn('param1 = root', index)
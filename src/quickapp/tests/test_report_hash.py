@@ -0,0 +1,62 @@
+import os
+
+from nose.tools import istest
+
+from quickapp.report_manager import write_report_with_links
+from reprep import Report
+from reprep.report_utils import StoreResults
+
+from .quickappbase import ReportFilesTest
+
+
+def make_report(text):
+    r = Report()
+    r.text('t', text)
+    return r
+
+
+@istest
+class ReportHashTest(ReportFilesTest):
+
+    def write(self, report, tree_dump='inline', timing=None):
+        report_html = os.path.join(self.root, 'r', 'r-1.html')
+        others = StoreResults()
+        others[dict(a=1)] = report_html
+        write_report_with_links(report=report, report_nid='r-1',
+                                report_html=report_html,
+                                index_filename=os.path.join(self.root, 'index.html'),
+                                this_report=dict(a=1),
+                                other_reports_same_type=others,
+                                most_similar_other_type=[],
+                                static_dir=os.path.join(self.root, 'static'),
+                                tree_dump=tree_dump, timing=timing)
+        return report_html
+
+    def skip_unchanged_test(self):
+        report_html = self.write(make_report('one'))
+        self.assertTrue(os.path.exists(report_html + '.sha1'))
+        os.utime(report_html, (1000, 1000))
+
+        self.write(make_report('one'))
+        self.assertEqual(os.path.getmtime(report_html), 1000)
+
+        self.write(make_report('two'))
+        self.assertNotEqual(os.path.getmtime(report_html), 1000)
+        with open(report_html) as f:
+            self.assertIn('two', f.read())
+
+    def tree_dump_test(self):
+        timing = {}
+        report_html = self.write(make_report('one'), tree_dump='sidecar', timing=timing)
+        tree_txt = os.path.join(self.root, 'r', 'r-1.tree.txt')
+        self.assertTrue(os.path.exists(tree_txt))
+        with open(report_html) as f:
+            self.assertIn('r-1.tree.txt', f.read())
+        self.assertTrue(timing['html'] > 0)
+
+        os.unlink(tree_txt)
+        # the mode is part of the content hash
+        self.write(make_report('one'), tree_dump='off')
+        self.assertFalse(os.path.exists(tree_txt))
+        with open(report_html) as f:
+            self.assertNotIn('tree.txt', f.read())
@@ -0,0 +1,57 @@
+import os
+import re
+
+from compmake import Context, Promise
+from compmake.storage.filesystem import StorageFilesystem
+from nose.tools import istest
+from quickapp import QuickAppContext, ReportManager
+from quickapp.report_manager import create_links_html, index_reports
+
+from .quickappbase import ReportFilesTest
+
+
+def hrefs(html):
+    return re.findall(r"href=['\"]([^'\"#]+)['\"]", html)
+
+
+@istest
+class ReportLayoutTest(ReportFilesTest):
+
+    def setUp(self):
+        ReportFilesTest.setUp(self)
+        cc = Context(db=StorageFilesystem(os.path.join(self.root, 'compmake')))
+        self.context = QuickAppContext(cc=cc, qapp=None, parent=None, job_prefix=None,
+                                       output_dir=self.root)
+
+    def hashed_test(self):
+        outdir = os.path.join(self.root, 'report')
+        rm = ReportManager(self.context, outdir)
+        rm.set_report_layout('hashed')
+        for i in range(4):
+            rm.add(self.context, Promise('job-%d' % i), 'my_report', i=i)
+        self.assertRaises(ValueError, rm.set_report_layout, 'flat')
+
+        reports = rm.allreports_filename
+        for filename in reports.values():
+            rel = os.path.relpath(filename, os.path.join(outdir, 'myreport'))
+            self.assertEqual(len(rel.split(os.sep)), 3, rel)
+            self.write_file(filename, 'report')
+        self.assertEqual(len(set(map(os.path.dirname, reports.values()))), 4)
+        index_reports(reports, rm.index_filename)
+
+        this_report = dict(i=0)
+        others = reports.select(report='my_report').remove_field('report')
+        html = create_links_html(this_report, others, rm.index_filename,
+                                 most_similar_other_type=[])
+        f0 = others[this_report]
+        links = hrefs(html)
+        self.assertEqual(len(links), 4)
+        for link in links:
+            self.assertTrue(os.path.exists(os.path.join(os.path.dirname(f0), link)), link)
+
+        with open(rm.index_filename) as f:
+            links = hrefs(f.read())
+        self.assertTrue(links)
+        for link in links:
+            target = os.path.join(os.path.dirname(rm.index_filename), link)
+            self.assertTrue(os.path.exists(target), link)
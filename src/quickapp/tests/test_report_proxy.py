@@ -0,0 +1,95 @@
+import io
+from contextlib import redirect_stdout
+
+from compmake.jobs.storage import get_job_userobject
+from nose.tools import istest
+
+from quickapp import QuickApp
+from reprep import Report
+from reprep_quickapp import ReportProxy, get_nodes
+from reprep_quickapp.report_proxy import (add_child_with_id, execute_proxy,
+                                          format_proxy_times, rp_create_figure)
+
+from .quickappbase import QuickappTest
+
+
+def make_source(i):
+    r = Report('source')
+    for name in ['a', 'b', 'c']:
+        child = Report(name)
+        child.text('t', '%s%d' % (name, i))
+        r.add_child(child)
+    r.resolve_url('a').add_child(Report('inner'))
+    return r
+
+
+class QuickAppProxy(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        for i in [1, 2]:
+            context.add_report(context.comp(make_source, i), 'source', i=i)
+
+        proxy = ReportProxy(context)
+        for i in [1, 2]:
+            for url in ['a', 'b', 'inner']:
+                proxy.add_child_from_other(url, None, 'source', i=i)
+        proxy.add_child_from_other('b', 'b-again', 'source', i=1)
+        context.add_report(proxy.get_job(), 'overview')
+
+
+class QuickAppTwoProxies(QuickApp):
+
+    def define_options(self, params):
+        pass
+
+    def define_jobs_context(self, context):
+        context.add_report(context.comp(make_source, 1), 'source', i=1)
+        for name in ['first', 'second']:
+            proxy = ReportProxy(context)
+            proxy.add_child_from_other('a', None, 'source', i=1)
+            context.add_report(proxy.get_job(), name)
+
+
+@istest
+class ReportProxyTest(QuickappTest):
+
+    def get_nodes_test(self):
+        r = make_source(1)
+        parts = get_nodes(['a', 'inner', 'b'], r)
+        # no shared nodes between the parts
+        self.assertIsNone(parts['a'].parent)
+        self.assertIsNone(parts['inner'].parent)
+        self.assertIsNot(parts['a'].resolve_url('inner'), parts['inner'])
+        # not copied
+        self.assertIs(parts['b'], r.resolve_url('b'))
+
+    def execute_proxy_test(self):
+        operations = [(rp_create_figure, dict(id_parent='report', nid='f')),
+                      (add_child_with_id, dict(id_parent='report', nid='c',
+                                               child=make_source(1)))]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            report = execute_proxy(operations, timing=True)
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual([c.nid for c in report.children], ['f', 'c'])
+        summary = format_proxy_times(dict(add_child_with_id=[2, 0.5]))
+        self.assertIn('2 x add_child_with_id', summary)
+
+    def report_proxy_test(self):
+        self.run_quickapp(QuickAppProxy, cmd='make recurse=1')
+        # one job per source report
+        self.assertEqual(len(self.get_jobs('get_parts-*')), 2)
+        overview = get_job_userobject('execute_proxy', self.db)
+        self.assertEqual(len(overview.children), 7)
+        self.assertEqual(overview.resolve_url('b-again').children[0].raw_data, 'b1')
+
+    def two_proxies_test(self):
+        # both take parts of the same report
+        self.run_quickapp(QuickAppTwoProxies, cmd='make recurse=1')
+        self.assertEqual(len(self.get_jobs('get_parts-*')), 2)
+        for job_id in ['execute_proxy', 'execute_proxy-2']:
+            report = get_job_userobject(job_id, self.db)
+            self.assertEqual(report.children[0].resolve_url('t').raw_data, 'a1')
@@ -0,0 +1,27 @@
+import pickle
+import unittest
+
+from quickapp import ReportManager
+from quickapp.rm import ReportRegistry
+
+
+class TestReportRegistry(unittest.TestCase):
+
+    def test_pickle(self):
+        registry = ReportRegistry()
+        for i in range(100):
+            registry.add(dict(report='r', i=i), 'job-%d' % i, 'r/r-%d.html' % i)
+        registry.check_format('r', ['i'])
+        registry2 = pickle.loads(pickle.dumps(registry))
+        self.assertEqual(len(registry2), 100)
+        self.assertEqual(registry2.get_job_id(dict(i=3, report='r')), 'job-3')
+        self.assertEqual(registry2.get_filename(dict(i=3, report='r')), 'r/r-3.html')
+        self.assertEqual([x[1] for x in registry2.items(since=98)], ['job-98', 'job-99'])
+        self.assertRaises(ValueError, registry2.check_format, 'r', ['i', 'j'])
+
+    def test_no_context(self):
+        rm = ReportManager(context=object(), outdir='out')
+        rm._registry.add(dict(report='r', i=1), 'job-1', 'out/r/r-1.html')
+        rm2 = pickle.loads(pickle.dumps(rm))
+        self.assertEqual(rm2.allreports[dict(report='r', i=1)].job_id, 'job-1')
+        self.assertEqual(rm2.allreports_filename[dict(report='r', i=1)], 'out/r/r-1.html')
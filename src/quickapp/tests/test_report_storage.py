@@ -0,0 +1,68 @@
+import os
+import pickle
+
+from compmake.jobs.storage import get_job_userobject
+from nose.tools import istest
+
+from quickapp.rm import IndexedReport, save_report_indexed
+from reprep import NotExistent, Report
+
+from .quickappbase import QuickappTest
+from .test_report_proxy import QuickAppProxy
+from .test_reportmanager_1 import QuickAppDemoReport
+
+
+def make_report():
+    r = Report('main')
+    for i in range(3):
+        s = r.section('s%d' % i)
+        s.text('t', 'text %d' % i)
+        f = s.figure('fig')
+        with f.plot('p') as pylab:
+            pylab.plot([1, 2, i])
+    return r
+
+
+class QuickAppDemoReportIndexed(QuickAppDemoReport):
+
+    def define_jobs_context(self, context):
+        context.get_report_manager().set_report_storage('indexed')
+        QuickAppDemoReport.define_jobs_context(self, context)
+
+
+class QuickAppProxyIndexed(QuickAppProxy):
+
+    def define_jobs_context(self, context):
+        context.get_report_manager().set_report_storage('indexed')
+        QuickAppProxy.define_jobs_context(self, context)
+
+
+@istest
+class ReportStorageTest(QuickappTest):
+
+    def indexed_report_test(self):
+        r = make_report()
+        handle = save_report_indexed(r, os.path.join(self.root0, 'r.qareport'))
+        self.assertEqual(handle.load(), r)
+
+        handle = pickle.loads(pickle.dumps(handle))
+        part = handle.load('s1')
+        self.assertEqual(part, r.resolve_url('s1'))
+        self.assertIsNone(part.parent)
+        self.assertEqual(part.resolve_url('t').raw_data, 'text 1')
+        self.assertEqual(part.resolve_url('fig').subfigures,
+                         r.resolve_url('s1/fig').subfigures)
+        self.assertRaises(NotExistent, handle.load, 's4')
+
+    def indexed_app_test(self):
+        self.run_quickapp(QuickAppDemoReportIndexed, cmd='make recurse=1')
+        self.assertEqual(len(self.get_jobs('*-indexed')), 8)
+        report_dir = os.path.join(self.root0, 'report', 'reportexample1')
+        self.assertEqual(len([x for x in os.listdir(report_dir) if x.endswith('.html')]), 4)
+
+    def indexed_proxy_test(self):
+        self.run_quickapp(QuickAppProxyIndexed, cmd='make recurse=1')
+        self.assertIsInstance(get_job_userobject('make_source-indexed', self.db), IndexedReport)
+        overview = get_job_userobject('execute_proxy', self.db)
+        self.assertEqual(len(overview.children), 7)
+        self.assertEqual(overview.resolve_url('b-again').children[0].raw_data, 'b1')
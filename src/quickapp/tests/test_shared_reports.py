@@ -0,0 +1,48 @@
+import os
+import pickle
+
+from nose.tools import istest
+
+from quickapp.rm import (LatestSharedReportsRef, VariationTable, resolve_shared,
+                         save_latest_shared_reports, save_shared_reports)
+from reprep.report_utils import StoreResults
+
+from .quickappbase import ReportFilesTest
+
+
+@istest
+class SharedReportsTest(ReportFilesTest):
+
+    def content_addressed_test(self):
+        reports = StoreResults()
+        reports[dict(report='a', x=1)] = '/out/a-1.html'
+        reports[dict(report='a', x=2)] = '/out/a-2.html'
+        ref1 = save_shared_reports(self.root, reports)
+        ref2 = save_shared_reports(self.root, reports)
+        self.assertEqual(ref1, ref2)
+        self.assertEqual(len(os.listdir(self.root)), 1)
+
+        ref3 = pickle.loads(pickle.dumps(ref1))
+        self.assertEqual(ref1, ref3)
+        self.assertEqual(dict(resolve_shared(ref3)), dict(reports))
+        table = resolve_shared(ref3.for_type('a'))
+        self.assertIsInstance(table, VariationTable)
+        self.assertEqual(table.filename(dict(x=2)), '/out/a-2.html')
+
+        # adding a report changes the reference
+        reports[dict(report='a', x=3)] = '/out/a-3.html'
+        ref4 = save_shared_reports(self.root, reports)
+        self.assertNotEqual(ref1, ref4)
+        self.assertNotEqual(ref1.for_type('a'), ref4.for_type('a'))
+
+    def latest_test(self):
+        reports = StoreResults()
+        reports[dict(report='a', x=1)] = '/out/a-1.html'
+        latest1 = save_latest_shared_reports(save_shared_reports(self.root, reports))
+        reports[dict(report='a', x=2)] = '/out/a-2.html'
+        latest2 = save_latest_shared_reports(save_shared_reports(self.root, reports))
+        # the reference does not change, what it refers to does
+        self.assertEqual(latest1, latest2)
+        self.assertEqual(latest1, LatestSharedReportsRef(self.root))
+        self.assertEqual(dict(resolve_shared(pickle.loads(pickle.dumps(latest1)))),
+                         dict(reports))
@@ -0,0 +1,33 @@
+import random
+
+from quickapp.report_manager import get_most_similar, sort_by_type
+from quickapp.rm import SimilarityIndex
+from reprep.report_utils import StoreResults
+
+
+def random_reports(seed):
+    rnd = random.Random(seed)
+    reports = StoreResults()
+    for report_type, fields in [('a', ['x', 'y']), ('b', ['x', 'z']), ('c', ['x', 'y', 'z'])]:
+        for _ in range(30):
+            key = dict(report=report_type)
+            for field in fields:
+                key[field] = rnd.choice(['v1', 'v2', 'v3', 1, 2])
+            reports[key] = '%s.html' % len(reports)
+    return reports
+
+
+def test_similarity_index_same_as_get_most_similar():
+    for seed in range(10):
+        reports = random_reports(seed)
+        type2reports = sort_by_type(reports)
+        similarity = SimilarityIndex(type2reports)
+        for key in reports:
+            key = dict(**key)
+            report_type = key.pop('report')
+            for other_type, others in type2reports.items():
+                if other_type == report_type:
+                    continue
+                expected = get_most_similar(others, key)
+                found = similarity.most_similar(other_type, key)
+                assert expected == found, (key, other_type, expected, found)
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+from quickapp.report_manager import (create_links_html, create_links_html_table, find_others,
+                                     sort_by_type)
+from quickapp.rm import VariationTable
+from reprep.report_utils import StoreResults
+
+
+def test_variation_table():
+    reports = StoreResults()
+    for a in [1, 2, 3]:
+        for b in ['x', 'y']:
+            if (a, b) == (3, 'y'):
+                continue
+            reports[dict(a=a, b=b)] = '/out/r/%s-%s.html' % (a, b)
+
+    table = VariationTable(reports)
+    assert table.filename(dict(a=2, b='y')) == '/out/r/2-y.html'
+    assert table.variations(dict(a=2, b='y'), 'a') == [(1, '/out/r/1-y.html'),
+                                                       (2, '/out/r/2-y.html'),
+                                                       (3, None)]
+    assert table.variations(dict(a=3, b='x'), 'b') == [('x', '/out/r/3-x.html'),
+                                                       ('y', None)]
+
+    cols = dict(create_links_html_table(dict(a=2, b='y'), table))
+    assert cols['a'] == [(1, '1-y.html'), ('2', None), ('3 (n/a)', None)]
+    assert cols['b'] == [('x', '2-x.html'), ('y', None)]
+    # same result from the StoreResults
+    assert dict(create_links_html_table(dict(a=2, b='y'), reports)) == cols
+
+    # the part needed for the links of one report
+    restricted = table.restrict(dict(a=2, b='y'))
+    assert dict(create_links_html_table(dict(a=2, b='y'), restricted)) == cols
+    assert restricted == table.restrict(dict(a=2, b='y'))
+    assert restricted != table.restrict(dict(a=1, b='y'))
+    # a report in another row and column does not change it
+    reports[dict(a=3, b='y')] = '/out/r/3-y.html'
+    assert VariationTable(reports).restrict(dict(a=1, b='x')) == table.restrict(dict(a=1, b='x'))
+
+
+def links_sha1():
+    """ The hash of the links of a report with 3 fields and 3 other types. """
+    import hashlib
+    reports = StoreResults()
+    for report_type in ['t1', 't2', 't3', 't4']:
+        for a in [1, 2]:
+            reports[dict(report=report_type, alpha=a, beta='b', gamma=a * 2)] = \
+                '/out/%s/%s.html' % (report_type, a)
+    type2reports = sort_by_type(reports)
+    key = dict(report='t1', alpha=1, beta='b', gamma=2)
+    others = find_others(type2reports, key)
+    del key['report']
+    html = create_links_html(key, type2reports['t1'], '/out/index.html', others)
+    return hashlib.sha1(html.encode()).hexdigest()
+
+
+def test_links_do_not_depend_on_hash_seed():
+    code = 'from quickapp.tests.test_variations import links_sha1; print(links_sha1())'
+    results = set()
+    for seed in ['0', '1', '2']:
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        out = subprocess.check_output([sys.executable, '-c', code], env=env)
+        results.add(out.decode().strip().split('\n')[-1])
+    assert len(results) == 1, results
@@ -0,0 +1,95 @@
+import os
+
+from compmake import Promise, set_compmake_config
+from compmake.jobs.storage import all_jobs, get_job_args
+from nose.tools import istest
+
+from quickapp import QuickApp, quickapp_main
+from quickapp.report_manager import make_write_batches
+from reprep import Report
+
+from .quickappbase import QuickappTest
+from .test_reportmanager_1 import QuickAppDemoReport
+
+
+class QuickAppDemoReportBatches(QuickAppDemoReport):
+
+    def define_jobs_context(self, context):
+        context.get_report_manager().set_write_batches(3)
+        QuickAppDemoReport.define_jobs_context(self, context)
+
+
+def make_report(x):
+    r = Report()
+    r.text('x', str(x))
+    return r
+
+
+class QuickAppManyReports(QuickApp):
+
+    def define_options(self, params):
+        params.add_int('ns', default=2)
+
+    def define_jobs_context(self, context):
+        context.get_report_manager().set_write_batches(3)
+        for i in range(40):
+            context.add_report(context.comp(make_report, i), 'r', i=i)
+        # (no value in common with the others: no links between the types)
+        for i in range(self.get_options().ns):
+            name = 'x%d' % i
+            context.add_report(context.comp(make_report, name), 's', name=name)
+
+
+@istest
+class WriteBatchesTest(QuickappTest):
+
+    def write_batches_test(self):
+        items = [('r-%d' % i, i) for i in range(200)]
+        batches = make_write_batches(items, 10)
+        self.assertEqual(sorted(x for b in batches for x in b), sorted(items))
+        self.assertTrue(len(batches) > 5)
+
+        # adding one element changes only the batch that contains it
+        items2 = items + [('r-100a', None)]
+        batches2 = make_write_batches(items2, 10)
+        changed = [b for b in batches2 if not b in batches]
+        self.assertTrue(len(changed) <= 2)
+        self.assertTrue(any(('r-100a', None) in b for b in changed))
+
+    def write_batches_app_test(self):
+        self.run_quickapp(QuickAppDemoReportBatches, cmd='make recurse=1')
+        jobs = self.get_jobs('*-batch-*')
+        self.assertTrue(0 < len(jobs) < 8)
+        report_dir = os.path.join(self.root0, 'report', 'reportexample1')
+        self.assertEqual(len([x for x in os.listdir(report_dir) if x.endswith('.html')]), 4)
+        self.assertTrue(os.path.exists(os.path.join(self.root0, 'report.html')))
+
+    def new_report_test(self):
+        def run(ns):
+            args = ['-o', self.root0, '-c', 'make recurse=1', '--compress', '--ns', str(ns)]
+            self.assertEqual(0, quickapp_main(QuickAppManyReports, args, sys_exit=False))
+            return dict((job_id, without_promises(get_job_args(job_id, self.db)))
+                        for job_id in all_jobs(self.db) if job_id.startswith('write-batch-'))
+
+        # (otherwise the index job is not redefined)
+        set_compmake_config('check_params', True)
+        try:
+            before = run(2)
+            after = run(3)
+        finally:
+            set_compmake_config('check_params', False)
+        self.assertTrue(len(before) > 10)
+        # only the batches of the type of the new report are invalidated
+        changed = [job_id for job_id in after if after[job_id] != before.get(job_id)]
+        self.assertTrue(1 <= len(changed) <= 2, changed)
+
+
+def without_promises(x):
+    """ Replaces the promises (which compare by identity) with their job ids. """
+    if isinstance(x, Promise):
+        return ('promise', x.job_id)
+    if isinstance(x, dict):
+        return dict((k, without_promises(v)) for k, v in x.items())
+    if isinstance(x, (list, tuple)):
+        return type(x)(without_promises(v) for v in x)
+    return x
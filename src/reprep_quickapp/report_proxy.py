@@ -1,15 +1,17 @@
 from __future__ import print_function
 from copy import deepcopy
+import time
 
 from contracts import contract
 
 from compmake import Promise
 from quickapp import CompmakeContext
 from quickapp.report_manager import basename_from_key
+from quickapp.rm import IndexedReport
 from reprep import NotExistent, Report, logger
 
 
-__all__ = ['ReportProxy', 'get_node']
+__all__ = ['ReportProxy', 'get_node', 'get_nodes']
 
 
 class FigureProxy(object):
@@ -24,11 +26,20 @@ class FigureProxy(object):
     
 class ReportProxy(object):
     
-    @contract(context=CompmakeContext)
-    def __init__(self, context):
+    @contract(context=CompmakeContext, verbose='bool', timing='bool')
+    def __init__(self, context, verbose=False, timing=False):
+        """ 
+            :param verbose: log the tree of every child added, and of the result.
+            :param timing: log the time spent in each kind of operation.
+        """
         self.context = context
+        self.verbose = verbose
+        self.timing = timing
         self.operations = []
         self.resources = {}
+        # key -> (report_type, report_args, strict, urls) for the
+        # parts requested by add_child_from_other(); see get_job()
+        self.parts_requested = {}
         
     def op(self, function, **kwargs):
         self.operations.append((function, kwargs))
@@ -45,12 +56,22 @@ class ReportProxy(object):
         self.op(add_child_with_id, id_parent='report', child=child, nid=nid)
     
     def add_child_from_other(self, url, nid, report_type, strict=True, **report_args):
-        part = self.get_part_of(url, report_type, strict=strict, ** report_args)
+        """ 
+            Adds the part ``url`` of another report. All the parts taken 
+            from the same report are extracted by one job (see get_parts_of()),
+            created by get_job().
+        """
+        key = get_parts_key(report_type, report_args, strict)
+        if not key in self.parts_requested:
+            self.parts_requested[key] = (report_type, report_args, strict, [])
+        urls = self.parts_requested[key][3]
+        if not url in urls:
+            urls.append(url)
         
         if nid is None:
             nid = basename_from_key(report_args) + '-' + url.replace('/', '-')  # XXX url chars
             
-        self.add_child_with_id(part, nid)
+        self.op(rp_add_part, id_parent='report', parts_key=key, url=url, nid=nid)
         return nid
  
     @contract(returns=Promise, url=str, report_type=str)
@@ -60,14 +81,45 @@ class ReportProxy(object):
         job_id += '-' + url.replace('/', '_')  # XXX
         part = self.context.comp(get_node, url=url, r=r, strict=strict, job_id=job_id)
         return part
+
+    @contract(returns=Promise, urls='list(str)', report_type=str)
+    def get_parts_of(self, urls, report_type, strict=True, **report_args):
+        """ 
+            Like get_part_of(), for several urls of the same report, 
+            which is loaded only once: returns the promise of a dict
+            url -> Report.
+
+            The job is named after the report, and numbered by compmake,
+            as other proxies can take parts of the same report. The loads
+            are not shared between proxies: each proxy loads the report
+            once, so it is better to use one proxy for all the parts of
+            a report.
+        """
+        command_name = get_parts_key(report_type, report_args, strict)
+        r = self.context.get_report(report_type, **report_args)
+        return self.context.comp(get_nodes, urls=urls, r=r, strict=strict,
+                                 command_name=command_name)
     
     @contract(returns=Promise)
     def get_job(self):
-        return self.context.comp(execute_proxy, self.operations) 
+        parts = {}
+        for key, (report_type, report_args, strict, urls) in self.parts_requested.items():
+            parts[key] = self.get_parts_of(urls, report_type, strict=strict, **report_args)
+        return self.context.comp(execute_proxy, self.operations, parts=parts,
+                                 verbose=self.verbose, timing=self.timing)
+
+
+def get_parts_key(report_type, report_args, strict):
+    key = 'get_parts-' + report_type + '-' + basename_from_key(report_args)
+    if not strict:
+        key += '-nonstrict'
+    return key
     
 
-@contract(url=str, r=Report, returns=Report)
+@contract(url=str, r='isinstance(ReportInterface)|isinstance(IndexedReport)', returns=Report)
 def get_node(url, r, strict=True):
+    if isinstance(r, IndexedReport):
+        return load_part(url, r, strict)
     try:
         node = r.resolve_url(url)
     except NotExistent as e:
@@ -79,19 +131,100 @@ def get_node(url, r, strict=True):
             logger.warn('Ignoring error: %s' % e)
             return Report()
 
-    node = deepcopy(node)
-    node.parent = None
-    return node
+    # (not the rest of the report)
+    return copy_detached(node)
+
+
+@contract(urls='list(str)', r='isinstance(ReportInterface)|isinstance(IndexedReport)',
+          returns='dict(str:$Report)')
+def get_nodes(urls, r, strict=True):
+    """ 
+        Extracts several parts of the report ``r``: returns a dict url -> Report.
+        
+        The report was loaded just for this job, so the parts are
+        detached from it rather than copied; only a part contained 
+        in another one is copied, so that the parts do not share nodes.
+        
+        If ``r`` is an IndexedReport, only the parts are loaded.
+    """
+    if isinstance(r, IndexedReport):
+        return dict((url, load_part(url, r, strict)) for url in urls)
+
+    nodes = {}
+    for url in urls:
+        try:
+            nodes[url] = r.resolve_url(url)
+        except NotExistent as e:
+            if strict:
+                logger.error('Error while getting url %r\n%s' % (url,
+                                                                 r.format_tree()))
+                raise
+            else:
+                logger.warn('Ignoring error: %s' % e)
+                nodes[url] = Report()
+
+    # resolve everything before detaching (urls can use '..')
+    selected = set(id(node) for node in nodes.values())
+    parts = {}
+    used = set()
+    for url, node in nodes.items():
+        if id(node) in used or is_inside(node, selected):
+            node = copy_detached(node)
+        used.add(id(node))
+        parts[url] = node
+    for node in parts.values():
+        node.parent = None
+    return parts
+
+
+def load_part(url, r, strict=True):
+    """ Loads the part ``url`` of an IndexedReport. """
+    try:
+        return r.load(url)
+    except NotExistent as e:
+        if strict:
+            logger.error('Error while getting url %r from %s' % (url, r.filename))
+            raise
+        else:
+            logger.warn('Ignoring error: %s' % e)
+            return Report()
+
+
+def is_inside(node, ids):
+    """ True if one of the ancestors of ``node`` is in ``ids``. """
+    parent = node.parent
+    while parent is not None:
+        if id(parent) in ids:
+            return True
+        parent = parent.parent
+    return False
+
+
+def copy_detached(node):
+    """ Copies the subtree of ``node``, without its ancestors. """
+    copy = deepcopy(node, {id(node.parent): None})
+    copy.parent = None
+    return copy
 
 
 @contract(resources='dict', id_parent='str', child=Report, nid='str')
 def add_child_with_id(resources, id_parent, child, nid):
     parent = resources[id_parent]
     child.nid = nid
-    print(child.format_tree())
+    if resources.get('verbose', False):
+        logger.info(child.format_tree())
     parent.add_child(child)
 
     
+@contract(resources='dict', id_parent='str', parts_key='str', url='str', nid='str')
+def rp_add_part(resources, id_parent, parts_key, url, nid):
+    child = resources['parts'][parts_key][url]
+    if child.parent is not None:
+        # the same part was already added once
+        child = copy_detached(child)
+    add_child_with_id(resources, id_parent=id_parent, child=child, nid=nid)
+
+
 @contract(resources='dict', id_parent='str', nid='str')
 def rp_create_figure(resources, id_parent, nid, **figargs):
     parent = resources[id_parent]
@@ -107,11 +240,33 @@ def rp_figure_sub(resources, id_figure, what, caption=None):
         logger.error(e)
         
 
-def execute_proxy(operations):
+def execute_proxy(operations, parts=None, verbose=False, timing=False):
     report = Report()
     resources = {}
     resources['report'] = report
+    # parts key -> url -> Report, see ReportProxy.get_job()
+    resources['parts'] = parts or {}
+    resources['verbose'] = verbose
+    # operation -> [number of calls, seconds]
+    times = {}
     for what, kwargs in operations:
-        what(resources=resources, **kwargs)
-    print(report.format_tree())
+        if timing:
+            t0 = time.time()
+            what(resources=resources, **kwargs)
+            t = times.setdefault(what.__name__, [0, 0.0])
+            t[0] += 1
+            t[1] += time.time() - t0
+        else:
+            what(resources=resources, **kwargs)
+    if timing:
+        logger.info(format_proxy_times(times))
+    if verbose:
+        logger.info(report.format_tree())
     return report
+
+
+def format_proxy_times(times):
+    s = 'Time spent by execute_proxy():'
+    for name, (n, seconds) in sorted(times.items(), key=lambda x: -x[1][1]):
+        s += '\n %8.3f s  %6d x %s' % (seconds, n, name)
+    return s